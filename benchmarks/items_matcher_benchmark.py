@@ -0,0 +1,77 @@
+"""Compares the per-item fuzzy loop with the batched ItemsMatcher.
+
+The matcher must give the same final match as the per-item loop
+for every entry; the script exits with status 1 if it doesn't.
+
+Run from the project root:
+    python -m benchmarks.items_matcher_benchmark --catalog 2240 --entries 500
+"""
+import argparse
+import sys
+import time
+
+from benchmarks.synthetic_catalog import build_catalog, build_entries
+from logic.message_processing.items_matcher import ItemsMatcher, find_top5_item_matches, filter_by_grade_and_duration
+
+
+# Groups entries the way they arrive: a few offers per trade message
+def split_into_messages(entries, per_message=3):
+    return [entries[i:i + per_message] for i in range(0, len(entries), per_message)]
+
+
+def run(catalog_size, entries_count, per_message):
+    items = build_catalog(catalog_size)
+    entries = build_entries(items, entries_count)
+    messages = split_into_messages(entries, per_message)
+
+    started = time.perf_counter()
+    reference = [find_top5_item_matches(items, entry) for entry in entries]
+    loop_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    matcher = ItemsMatcher(items)
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batched = []
+    for message_entries in messages:
+        batched.extend(matcher.find_top_matches(message_entries))
+    batched_seconds = time.perf_counter() - started
+
+    best = []
+    for message_entries in messages:
+        best.extend(matcher.find_best_matches(message_entries))
+
+    mismatches = sum(
+        1 for old, new in zip(reference, batched)
+        if [(c["index"], c["score"]) for c in old] != [(c["index"], c["score"]) for c in new]
+    )
+
+    # Final match of the old path (global top 5, then filters) vs the matcher
+    reference_best = [
+        filter_by_grade_and_duration(top5, entry, items) for entry, top5 in zip(entries, reference)
+    ]
+    different_best = [
+        entry for entry, old, new in zip(entries, reference_best, best)
+        if (old and old["index"]) != (new and new["index"])
+    ]
+
+    print(f"Catalog: {len(items)} items, {len(entries)} entries in {len(messages)} messages")
+    print(f"find_top5_item_matches : {loop_seconds:8.3f}s  ({len(entries) / loop_seconds:10.1f} entries/s)")
+    print(f"ItemsMatcher build     : {build_seconds:8.3f}s")
+    print(f"ItemsMatcher batched   : {batched_seconds:8.3f}s  ({len(entries) / batched_seconds:10.1f} entries/s)")
+    print(f"Speedup                : {loop_seconds / batched_seconds:8.1f}x")
+    print(f"Result mismatches      : {mismatches}")
+    print(f"Final match mismatches : {len(different_best)}")
+    for entry in different_best[:10]:
+        print(f"    {entry}")
+    return not mismatches and not different_best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--catalog", type=int, default=2240, help="number of catalog items")
+    parser.add_argument("--entries", type=int, default=500, help="number of parsed offer entries")
+    parser.add_argument("--per-message", type=int, default=3, help="entries per trade message")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.catalog, args.entries, args.per_message) else 1)
@@ -0,0 +1,70 @@
+"""Checks that a restarted worker finds arbitrage against offers stored before the restart.
+
+Stores a SELL offer through the worker's write path, reloads the order book from the
+database as a starting worker does, then stores a crossing BUY offer and expects an
+arbitrage record. On SQLite this covers naive sent_at values read back from the database.
+Point ENGINE_URL at a scratch database (PostgreSQL or sqlite+aiosqlite:///check.db).
+
+Run from the project root:
+    python -m benchmarks.order_book_restart_check
+"""
+import asyncio
+import logging
+import sys
+import uuid
+
+from benchmarks.pipeline_benchmark import FakeEvent, seed_catalog
+from database.db_main import engine
+from database.models import OfferType, CurrencyType
+from database.queries import init_db, hash_message
+from logic.message_processing.message_processor import save_message_offers_and_arbitrage
+from logic.message_processing.order_book import order_book
+
+
+def offer_data(item, offer_type, price, message):
+    return {
+        "id": None,
+        "item_name_message": item.item_name,
+        "item_name_db": item.item_name,
+        "item_name": item.item_name,
+        "item_id": item.id,
+        "quantity": 1,
+        "offer_type": offer_type,
+        "currency": CurrencyType.COOKIES,
+        "price_for_one": price,
+        "message_id": None,
+        "message_hash": hash_message(message.raw_text),
+        "seen_at": message.date
+    }
+
+
+async def store(message_id, item, offer_type, price):
+    message = FakeEvent(message_id, f"restart check {uuid.uuid4().hex}")
+    sender = await message.get_sender()
+    return await save_message_offers_and_arbitrage(
+        message, sender, [offer_data(item, offer_type, price, message)]
+    )
+
+
+async def run_check():
+    await init_db()
+    item = (await seed_catalog())[0]
+
+    await store(1, item, OfferType.SELL, 100)
+    await order_book.load()  # what a restarted worker starts from
+    try:
+        arbitrage_ids = await store(2, item, OfferType.BUY, 150)
+    finally:
+        await engine.dispose()
+
+    if not arbitrage_ids:
+        print("FAIL  crossing BUY after restart created no arbitrage record")
+        return False
+    print(f"OK    crossing BUY after restart created {len(arbitrage_ids)} arbitrage records")
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    engine.echo = False
+    sys.exit(0 if asyncio.run(run_check()) else 1)
@@ -0,0 +1,297 @@
+"""End-to-end throughput of the trade message pipeline with local stand-ins for Telegram and the LLM.
+
+Synthetic (or recorded) trade messages go through the worker's queue, message processing,
+the real database and the notification queue. The model is replaced by a local
+OpenAI-compatible server with configurable latency, and the notification bot by a fake one.
+The worker writes messages, offers and arbitrage records, so point ENGINE_URL at a scratch
+PostgreSQL database (or sqlite+aiosqlite:///bench.db); an empty items table is filled with
+the synthetic catalog. Other settings come from the usual .env; Telegram is never contacted.
+
+Run from the project root:
+    python -m benchmarks.pipeline_benchmark --messages 500 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+from aiohttp import web
+from openai import AsyncOpenAI
+from sqlalchemy import event
+
+import parser.group_message_parser as group_message_parser
+import logic.message_processing.message_processor as message_processor
+import telegram.bot.arbitrage_notification_bot as notification_bot
+from benchmarks.prefilter_benchmark import load_corpus
+from benchmarks.synthetic_catalog import build_catalog
+from config import settings
+from database.db_main import engine, session_factory
+from database.models import Items, ItemType
+from database.queries import init_db, get_items
+from parser.rule_based_parser import parse_with_rules, rule_parser_stats
+from tracing import start_trace
+
+STAGES = ["queue", "parse", "match", "store", "total"]
+
+
+# Stage latencies and DB round trips of one run
+class PipelineStats:
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.round_trips = 0
+        self.notifications = 0
+
+    def record(self, stage, seconds):
+        self.latencies[stage].append(seconds)
+
+    def count_round_trip(self, *args):
+        self.round_trips += 1
+
+
+# Synthetic trade messages over the catalog, with the offers the model stub answers for them.
+# Buy and sell prices of an item overlap, so part of the offers form arbitrage pairs.
+def build_messages(items_in_db, count, seed=7):
+    rng = random.Random(seed)
+    run_tag = uuid.uuid4().hex[:6]  # fresh texts on every run, so the deduplicator lets them through
+    popular = rng.sample(list(items_in_db), min(len(items_in_db), 200))
+    messages = []
+    for n in range(count):
+        offers = []
+        for item in rng.sample(popular, rng.randint(1, 3)):
+            offer_type = rng.choice(["sell", "buy"])
+            base_price = 100 + item.id % 50 * 20
+            price = base_price + rng.randint(-30, 30) if offer_type == "sell" else base_price + rng.randint(-30, 10)
+            offers.append({
+                "item_name": item.item_name,
+                "item_grade": item.item_grade,
+                "item_duration": item.item_duration,
+                "quantity": rng.randint(1, 20),
+                "offer_type": offer_type,
+                "currency": "cookies",
+                "price_for_one": price
+            })
+
+        lines = [
+            f"{'продаю' if offer['offer_type'] == 'sell' else 'куплю'} {offer['item_name'].lower()} "
+            f"{'' if offer['item_grade'] == 'undefined' else offer['item_grade']} "
+            f"{offer['quantity']}шт по {offer['price_for_one']} печенек"
+            for offer in offers
+        ]
+        messages.append(("Всем привет!\n" + "\n".join(lines) + f"\nпишите в лс ({run_tag}-{n})", offers))
+    return messages
+
+
+# Recorded chat messages; the stub answers them with the rule-based parser's offers (or none)
+def recorded_messages(count):
+    corpus = load_corpus()
+    return [(corpus[n % len(corpus)] + f"\n#{n}", None) for n in range(count)]
+
+
+# OpenAI-compatible /chat/completions answering from the known offers of each message
+class ModelStub:
+
+    def __init__(self, answers, latency, jitter, seed=11):
+        self.answers = answers
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.requests = 0
+
+    def offers(self, text):
+        offers = self.answers.get(text)
+        if offers is None:
+            offers = parse_with_rules(text) or []
+        return offers
+
+    async def chat_completions(self, request):
+        self.requests += 1
+        body = await request.json()
+        content = body["messages"][-1]["content"]
+
+        try:
+            payload = json.loads(content)
+        except json.JSONDecodeError:
+            payload = None
+
+        if isinstance(payload, dict) and "messages" in payload:
+            answer = {"results": [
+                {"id": message["id"], "items": self.offers(message["text"])} for message in payload["messages"]
+            ]}
+        else:
+            answer = {"items": self.offers(content)}
+
+        await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+        return web.json_response({
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(answer, ensure_ascii=False)},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://127.0.0.1:{port}/v1"
+
+
+# Stands in for the aiogram Bot used by the notifier
+class FakeBot:
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.stats.notifications += 1
+        return SimpleNamespace(message_id=self.stats.notifications)
+
+
+# Telethon NewMessage event with what the worker reads from it
+class FakeEvent:
+
+    def __init__(self, message_id, text):
+        self.raw_text = text
+        self.date = datetime.now(timezone.utc)
+        self.sender_id = 1000 + message_id % 50
+        self.message = SimpleNamespace(id=message_id)
+
+    async def get_sender(self):
+        return SimpleNamespace(id=self.sender_id, username=f"trader{self.sender_id}")
+
+
+async def seed_catalog():
+    items_in_db = await get_items()
+    if items_in_db:
+        return items_in_db
+
+    async with session_factory() as session:
+        session.add_all([
+            Items(
+                in_game_id=item.in_game_id, item_name=item.item_name, item_type=ItemType(item.item_type),
+                item_grade=item.item_grade, item_duration=item.item_duration
+            )
+            for item in build_catalog()
+        ])
+        await session.commit()
+    return await get_items()
+
+
+# Wraps pipeline stages of the message processor with timers
+def instrument(stats, queued_at):
+    def timed(stage, function):
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                stats.record(stage, time.perf_counter() - started)
+        return wrapper
+
+    message_processor.create_request = timed("parse", message_processor.create_request)
+    message_processor.match_entries = timed("match", message_processor.match_entries)
+    message_processor.save_message_offers_and_arbitrage = timed(
+        "store", message_processor.save_message_offers_and_arbitrage
+    )
+
+    handle_message = message_processor.handle_message
+
+    async def handle_and_time(matcher, message, ticket):
+        stats.record("queue", time.monotonic() - queued_at[message.message.id])
+        try:
+            return await handle_message(matcher, message, ticket)
+        finally:
+            stats.record("total", time.monotonic() - queued_at[message.message.id])
+
+    message_processor.handle_message = handle_and_time
+
+
+def percentiles(values):
+    if not values:
+        return "            -"
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return f"{p50:9.1f} {p95:9.1f} {p99:9.1f}"
+
+
+async def run(args):
+    # Per-message logs (ambiguous synthetic names included) would drown the report
+    logging.basicConfig(level=logging.ERROR)
+    notification_bot.logger.setLevel(logging.ERROR)
+    engine.echo = False
+
+    stats = PipelineStats()
+    await init_db()
+    items_in_db = await seed_catalog()
+    messages = recorded_messages(args.messages) if args.recorded else build_messages(items_in_db, args.messages)
+
+    stub = ModelStub({text: offers for text, offers in messages if offers}, args.llm_latency, args.llm_jitter)
+    runner, base_url = await stub.start()
+    group_message_parser.client = AsyncOpenAI(api_key="stub", base_url=base_url)
+    notification_bot.bot = FakeBot(stats)
+
+    queued_at = {}
+    instrument(stats, queued_at)
+    event.listen(engine.sync_engine, "before_cursor_execute", stats.count_round_trip)
+
+    queue = asyncio.Queue(maxsize=settings.offer_queue_size)
+    handler_task = asyncio.create_task(message_processor.message_handler(queue))
+    notifier_task = asyncio.create_task(notification_bot.arbitrage_notifier.run())
+
+    # Catalog, aliases and order book load before the clock starts
+    while message_processor.catalog.matcher is None or message_processor.queue_stats.queue is None:
+        await asyncio.sleep(0.05)
+    stats.round_trips = 0
+
+    started = time.monotonic()
+    for message_id, (text, _) in enumerate(messages):
+        if args.rate:
+            await asyncio.sleep(max(0.0, started + message_id / args.rate - time.monotonic()))
+        queued_at[message_id] = time.monotonic()
+        trace = start_trace("trade_message", chat_message_id=message_id)
+        await queue.put((FakeEvent(message_id, text), queued_at[message_id], trace))
+    await queue.join()
+    elapsed = time.monotonic() - started
+
+    for task in (handler_task, notifier_task):
+        task.cancel()
+    await asyncio.gather(handler_task, notifier_task, return_exceptions=True)
+    await runner.cleanup()
+    await engine.dispose()
+
+    print(f"Database: {engine.dialect.name}, workers: {settings.worker_concurrency}, "
+          f"LLM latency {args.llm_latency * 1000:.0f}±{args.llm_jitter * 1000:.0f} ms, "
+          f"batch size {group_message_parser.llm_batch_size}, rule parser {settings.rule_parser_mode}")
+    print(f"Messages                 : {len(messages)} in {elapsed:.2f}s = {len(messages) / elapsed:.1f} msgs/s")
+    print(f"Model requests           : {stub.requests} (served locally: {rule_parser_stats.served_locally})")
+    print(f"DB round trips           : {stats.round_trips} = {stats.round_trips / len(messages):.1f} per message")
+    print(f"Notifications sent       : {stats.notifications} (rest still queued by the rate limit)")
+    print(f"{'stage latency, ms':25}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage in STAGES:
+        print(f"{stage:25}{percentiles(stats.latencies[stage])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500, help="messages fed to the worker")
+    parser.add_argument("--rate", type=float, default=0, help="arrival rate, msgs/s (0: as fast as the queue takes them)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="mean model stub latency, seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.1, help="standard deviation of the stub latency, seconds")
+    parser.add_argument("--recorded", action="store_true", help="feed recorded chat messages instead of synthetic ones")
+    asyncio.run(run(parser.parse_args()))
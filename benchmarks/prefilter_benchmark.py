@@ -0,0 +1,80 @@
+"""Compares the fuzzy buy/sell prefilter with the compiled one on recorded chat messages.
+
+Run from the project root:
+    python -m benchmarks.prefilter_benchmark --repeat 200
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+from parser.trade_prefilter import contains_buy_sell, contains_buy_sell_fuzzy, token_matches
+
+CORPUS_PATH = Path(__file__).parent / "data" / "trade_messages.jsonl"
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["text"] for line in f if line.strip()]
+
+
+# Corpus messages with random typos (dropped, doubled and swapped letters)
+def mutate_corpus(messages, count, seed=13):
+    rng = random.Random(seed)
+    mutated = []
+    for _ in range(count):
+        text = list(rng.choice(messages))
+        for _ in range(rng.randint(1, 3)):
+            position = rng.randrange(len(text))
+            roll = rng.random()
+            if roll < 0.33:
+                del text[position]
+            elif roll < 0.66:
+                text.insert(position, text[position])
+            elif position + 1 < len(text):
+                text[position], text[position + 1] = text[position + 1], text[position]
+            if not text:
+                break
+        mutated.append("".join(text))
+    return mutated
+
+
+def measure(function, messages, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in messages:
+            function(text)
+    seconds = time.perf_counter() - started
+    return len(messages) * repeat / seconds
+
+
+def run(repeat, mutations):
+    messages = load_corpus()
+    checked = messages + mutate_corpus(messages, mutations)
+
+    mismatches = [text for text in checked if contains_buy_sell(text) != contains_buy_sell_fuzzy(text)]
+    accepted = sum(contains_buy_sell_fuzzy(text) for text in messages)
+
+    token_matches.cache_clear()
+    fuzzy_rate = measure(contains_buy_sell_fuzzy, messages, repeat)
+    token_matches.cache_clear()
+    cold_rate = measure(contains_buy_sell, messages, 1)
+    warm_rate = measure(contains_buy_sell, messages, repeat)
+
+    print(f"Corpus: {len(messages)} recorded messages ({accepted} pass the prefilter), "
+          f"{len(checked) - len(messages)} mutated variants")
+    print(f"Decision mismatches      : {len(mismatches)}")
+    for text in mismatches[:10]:
+        print(f"    {text!r}")
+    print(f"contains_buy_sell_fuzzy  : {fuzzy_rate:12.0f} messages/s")
+    print(f"contains_buy_sell (cold) : {cold_rate:12.0f} messages/s")
+    print(f"contains_buy_sell (warm) : {warm_rate:12.0f} messages/s  ({warm_rate / fuzzy_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200, help="passes over the corpus")
+    parser.add_argument("--mutations", type=int, default=5000, help="mutated messages checked for recall")
+    args = parser.parse_args()
+    run(args.repeat, args.mutations)
@@ -0,0 +1,72 @@
+import random
+from types import SimpleNamespace
+
+# Building blocks for a catalog shaped like the real one (equipment + resources)
+NAME_PARTS = [
+    "Меч", "Кирка", "Топор", "Щит", "Шлем", "Кольцо", "Амулет", "Посох", "Лук", "Кинжал",
+    "Зелье", "Рецепт", "Свиток", "Руна", "Камень", "Слиток", "Кожа", "Ткань", "Эссенция", "Пыль"
+]
+NAME_ADJECTIVES = [
+    "древний", "огненный", "ледяной", "теневой", "светлый", "кровавый", "рунный", "каменный",
+    "лесной", "морской", "звёздный", "проклятый", "святой", "гномий", "эльфийский", "орочий"
+]
+NAME_SUFFIXES = ["силы", "ловкости", "мудрости", "удачи", "жизни", "маны", "охотника", "воина", "мага", ""]
+GRADES = ["[I]", "[II]", "[III]", "[III+]", "[IV]", "[V]", "undefined"]
+DURATIONS = ["undefined", "undefined", "undefined", "30 минут", "1 час", "3 часа", "7 дней"]
+
+
+# Builds a deterministic synthetic catalog of Items-like objects
+def build_catalog(size=2240, seed=42):
+    rng = random.Random(seed)
+    items = []
+    seen = set()
+
+    while len(items) < size:
+        name = " ".join(filter(None, [
+            rng.choice(NAME_PARTS), rng.choice(NAME_ADJECTIVES), rng.choice(NAME_SUFFIXES)
+        ]))
+        grade = rng.choice(GRADES)
+        duration = rng.choice(DURATIONS)
+        if (name, grade, duration) in seen:
+            continue
+        seen.add((name, grade, duration))
+        items.append(SimpleNamespace(
+            id=len(items) + 1,
+            in_game_id=len(items),
+            item_name=name,
+            item_type="equipment" if len(items) % 3 else "resource",
+            item_grade=grade,
+            item_duration=duration
+        ))
+
+    return items
+
+
+# Builds parsed offer entries with typos, abbreviations and unknown grades/durations
+def build_entries(items, count=500, seed=7):
+    rng = random.Random(seed)
+    entries = []
+
+    for _ in range(count):
+        item = rng.choice(items)
+        name = item.item_name
+        roll = rng.random()
+        if roll < 0.3:
+            position = rng.randrange(len(name))
+            name = name[:position] + name[position + 1:]
+        elif roll < 0.5:
+            name = name.split(" ")[0] + " " + name.split(" ")[-1][:4]
+        elif roll < 0.6:
+            name = rng.choice(NAME_PARTS) + " " + rng.choice(NAME_ADJECTIVES)
+
+        entries.append({
+            "item_name": name,
+            "item_grade": item.item_grade if rng.random() < 0.7 else "undefined",
+            "item_duration": item.item_duration if rng.random() < 0.7 else "undefined",
+            "quantity": rng.choice([None, 1, 5, 10]),
+            "price_for_one": rng.randrange(10, 5000),
+            "offer_type": rng.choice(["buy", "sell"]),
+            "currency": rng.choice(["cookies", "money"])
+        })
+
+    return entries
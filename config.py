@@ -17,7 +17,46 @@ class Settings(BaseSettings):
     items_info_group_id: str
     equipment_last_id: int
     resource_last_id: int
-    app_mode: str
+    app_mode: str                         # collector | worker | catalog_export | catalog_import
+    worker_concurrency: int = 4           # number of message consumer tasks
+    offer_queue_size: int = 200           # bounded trade message queue (backpressure for the listener)
+    queue_stats_interval: int = 60        # seconds between queue depth / wait time reports
+    llm_batch_size: int = 1               # max messages per LLM request (1 disables batching, capped at worker_concurrency)
+    llm_batch_window: float = 0.5         # seconds to collect messages for one batch
+    parsed_cache_size: int = 5000         # parsed results kept per message hash (reposts skip the LLM)
+    rule_parser_mode: str = "shadow"      # off | shadow (compare with LLM) | on (skip LLM for template messages)
+    offer_freshness_hours: int = 72       # offers from older messages are ignored by arbitrage search
+    retention_interval: int = 600         # seconds between retention runs (expired rows moved to archive tables)
+    retention_batch_size: int = 500       # expired messages archived per transaction
+    notify_rate: float = 1.0              # bot notifications per second (Bot API allows ~1/s per chat)
+    notify_burst: int = 3                 # notifications that may be sent back to back
+    notify_coalesce_window: float = 3.0   # seconds to collect arbitrages of the same item into one digest
+    notify_digest_size: int = 5           # max arbitrages per digest message
+    collector_window: int = 4             # item info requests in flight at once
+    collector_rate: float = 1.0           # initial item info requests per second (adjusted by AIMD)
+    collector_max_rate: float = 5.0       # upper bound of the adjusted request rate
+    collector_timeout: float = 30.0       # seconds to wait for a reply before re-sending a request
+    collector_max_attempts: int = 5       # sends per request before it is given up
+    collector_progress_interval: int = 30 # seconds between collector progress reports
+    collector_force_refresh: bool = False # collector re-fetches every in-game id instead of resuming
+    collector_flush_size: int = 100       # parsed items written to DB in one batch
+    collector_flush_interval: float = 5.0 # max seconds a parsed item waits in the write buffer
+    catalog_snapshot_path: str = "catalog_snapshot.json.gz"  # items snapshot for catalog_export / catalog_import
+    worker_catalog_from_snapshot: bool = False  # worker builds its matcher from the snapshot file
+    catalog_reload_interval: int = 30     # seconds between worker checks for catalog changes
+    metrics_port: int = 0                 # worker metrics endpoint port, Prometheus text format (0 disables)
+    metrics_host: str = "0.0.0.0"         # metrics endpoint bind address
+    trace_mode: str = "off"               # span export: off | jsonl | otlp
+    trace_sample_rate: float = 0.05       # share of trade messages traced
+    trace_file: str = "traces.jsonl"      # span file for TRACE_MODE=jsonl
+    trace_otlp_endpoint: str = "http://localhost:4318/v1/traces"  # OTLP/HTTP collector for TRACE_MODE=otlp
+    trace_flush_interval: float = 5.0     # seconds between span exports
+    log_profile: str = "dev"              # dev (DEBUG, direct writes) | production (INFO, queued background writer)
+    log_level: str = ""                   # root log level (empty: the profile's default)
+    log_format: str = "text"              # text | json (one JSON object per line)
+    log_levels: str = ""                  # per-module levels, e.g. "telethon=WARNING,sqlalchemy.engine=INFO"
+    log_rate_limit: float = 60.0          # production: seconds between repeats of a repetitive warning (0: no limit)
+    db_echo: bool = False                 # log every SQL statement issued by the engine
 
     model_config = SettingsConfigDict(
         env_file=".env" if Path(".env").exists() else None,
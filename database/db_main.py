@@ -12,7 +12,7 @@ class Base(DeclarativeBase):
 # Async DB engine
 engine = create_async_engine(
     url=settings.engine_url,
-    echo=True # show SQL queries in console (disable in prod)
+    echo=settings.db_echo  # log every SQL statement (DB_ECHO, for debugging only)
 )
 logger.info(f"Async engine created for {settings.engine_url}")
 
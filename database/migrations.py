@@ -0,0 +1,140 @@
+import logging
+from sqlalchemy import text
+
+from database.db_main import engine
+
+logger = logging.getLogger(__name__)
+
+# Any constant works, it only has to be the same for every process running migrations
+MIGRATIONS_LOCK_ID = 724_551_001
+
+# Versioned schema migrations for databases created before a schema change.
+# Fresh databases get the same objects from the models via create_all; migrations then
+# find them in place. Every step must be safe on a live database: no table drops or
+# rewrites, indexes are built CONCURRENTLY (outside a transaction, without write locks).
+#   indexes    — (index name, CREATE INDEX CONCURRENTLY IF NOT EXISTS ...) pairs
+#   statements — other idempotent SQL statements
+MIGRATIONS = [
+    {
+        "version": 1,
+        "description": "hot-path and foreign key indexes for offers, arbitrage and item_aliases",
+        "indexes": [
+            ("ix_offers_item_currency_type_price",
+             "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_offers_item_currency_type_price "
+             "ON offers (item_id, currency, offer_type, price_for_one) INCLUDE (quantity)"),
+            ("ix_offers_message_id",
+             "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_offers_message_id ON offers (message_id)"),
+            ("ix_arbitrage_buy_offer",
+             "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_arbitrage_buy_offer ON arbitrage (buy_offer)"),
+            ("ix_arbitrage_sell_offer",
+             "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_arbitrage_sell_offer ON arbitrage (sell_offer)"),
+            ("ix_item_aliases_item_id",
+             "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_item_aliases_item_id ON item_aliases (item_id)"),
+        ],
+        "statements": [],
+    },
+    {
+        "version": 2,
+        "description": "messages.sent_at index and archive tables for expired messages, offers and arbitrage",
+        "indexes": [
+            ("ix_messages_sent_at",
+             "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_sent_at ON messages (sent_at)"),
+        ],
+        # Same columns as the hot tables, without keys, constraints or indexes
+        "statements": [
+            "CREATE TABLE IF NOT EXISTS messages_archive (LIKE messages)",
+            "CREATE TABLE IF NOT EXISTS offers_archive (LIKE offers)",
+            "CREATE TABLE IF NOT EXISTS arbitrage_archive (LIKE arbitrage)",
+        ],
+    },
+    {
+        "version": 3,
+        "description": "catalog version counter and items.catalog_version",
+        "indexes": [],
+        # A constant default doesn't rewrite the table
+        "statements": [
+            "ALTER TABLE items ADD COLUMN IF NOT EXISTS catalog_version BIGINT NOT NULL DEFAULT 0",
+            "CREATE TABLE IF NOT EXISTS catalog_version (id INTEGER PRIMARY KEY, version BIGINT NOT NULL)",
+        ],
+    },
+    {
+        "version": 4,
+        "description": "items.catalog_version index for live catalog reload",
+        "indexes": [
+            ("ix_items_catalog_version",
+             "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_items_catalog_version ON items (catalog_version)"),
+        ],
+        "statements": [],
+    },
+    {
+        "version": 5,
+        "description": "messages.last_seen_at for reposts (sent_at keeps the original date)",
+        "indexes": [],
+        # Nullable without default: no table rewrite; the archive copy gets the column too
+        "statements": [
+            "ALTER TABLE messages ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMPTZ",
+            "ALTER TABLE messages_archive ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMPTZ",
+        ],
+    },
+]
+
+
+# Applies pending migrations (PostgreSQL only; other dialects get the full schema from create_all)
+async def run_migrations():
+    if engine.dialect.name != "postgresql":
+        logger.info(f"Migrations skipped for {engine.dialect.name} database.")
+        return
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+
+        # Only one process (collector or worker) migrates at a time
+        await conn.execute(text("SELECT pg_advisory_lock(:lock_id)"), {"lock_id": MIGRATIONS_LOCK_ID})
+        try:
+            await conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description VARCHAR NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """))
+            result = await conn.execute(text("SELECT version FROM schema_migrations"))
+            applied = set(result.scalars().all())
+
+            for migration in MIGRATIONS:
+                if migration["version"] in applied:
+                    continue
+                await apply_migration(conn, migration)
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": MIGRATIONS_LOCK_ID})
+
+
+async def apply_migration(conn, migration):
+    logger.info(f"Applying migration {migration['version']}: {migration['description']}")
+
+    for index_name, statement in migration["indexes"]:
+        await drop_invalid_index(conn, index_name)
+        await conn.execute(text(statement))
+        logger.info(f"Index {index_name} is in place.")
+
+    for statement in migration["statements"]:
+        await conn.execute(text(statement))
+
+    await conn.execute(
+        text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+        {"version": migration["version"], "description": migration["description"]}
+    )
+    logger.info(f"Migration {migration['version']} applied.")
+
+
+# An interrupted CREATE INDEX CONCURRENTLY leaves an invalid index that IF NOT EXISTS would keep
+async def drop_invalid_index(conn, index_name):
+    result = await conn.execute(text("""
+        SELECT NOT i.indisvalid
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :index_name
+    """), {"index_name": index_name})
+
+    if result.scalar():
+        logger.warning(f"Dropping invalid index {index_name} left by an interrupted build.")
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
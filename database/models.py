@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 import enum
-from sqlalchemy import Integer, String, UniqueConstraint, Enum, ForeignKey, DateTime, BigInteger
+from sqlalchemy import Integer, String, UniqueConstraint, Enum, ForeignKey, DateTime, BigInteger, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from database.db_main import Base
 
@@ -30,10 +30,13 @@ class Items(Base):
     item_type: Mapped[ItemType] = mapped_column(Enum(ItemType), nullable=False)
     item_grade: Mapped[str] = mapped_column(String(10), nullable=False)
     item_duration: Mapped[str] = mapped_column(String(20), nullable=False)
+    # Catalog version of the last write (see CatalogVersion)
+    catalog_version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
 
     # Unique constraint on name, grade and duration
     __table_args__ = (
         UniqueConstraint("item_name", "item_grade", "item_duration", name="_name_grade_duration_uc"),
+        Index("ix_items_catalog_version", "catalog_version"),
     )
 
     # One-to-many relationship with Offers
@@ -53,11 +56,17 @@ class Messages(Base):
     message_text: Mapped[str] = mapped_column(String, nullable=False)
     message_text_hashed: Mapped[str] = mapped_column(String(256), nullable=False, unique=True)
     sent_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    last_seen_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)  # latest repost of the text
     added_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         default=lambda: datetime.now(timezone.utc)
     )
 
+    # Freshness window and retention both select messages by sent_at (and last_seen_at)
+    __table_args__ = (
+        Index("ix_messages_sent_at", "sent_at"),
+    )
+
     # One-to-many relationship with Offers
     offers: Mapped[list["Offers"]] = relationship(
         back_populates="message",
@@ -78,6 +87,18 @@ class Offers(Base):
     price_for_one: Mapped[int] = mapped_column(Integer, nullable=False)
     message_id: Mapped[int] = mapped_column(ForeignKey(Messages.id, ondelete="CASCADE"))
 
+    # Indexes (also created on live databases by database/migrations.py):
+    # crossing-offer lookup by item/currency/type/price (its leading item_id also serves the items FK),
+    # and the messages FK used by cascades
+    __table_args__ = (
+        Index(
+            "ix_offers_item_currency_type_price",
+            "item_id", "currency", "offer_type", "price_for_one",
+            postgresql_include=["quantity"]
+        ),
+        Index("ix_offers_message_id", "message_id"),
+    )
+
     # Relationships
     item: Mapped["Items"] = relationship(back_populates="offers")
     message: Mapped["Messages"] = relationship(back_populates="offers")
@@ -112,6 +133,12 @@ class Arbitrage(Base):
     price_for_all: Mapped[int] = mapped_column(Integer, nullable=True)
     quantity: Mapped[int] = mapped_column(Integer, nullable=True)
 
+    # Indexes for the offers FKs (ON DELETE CASCADE lookups)
+    __table_args__ = (
+        Index("ix_arbitrage_buy_offer", "buy_offer"),
+        Index("ix_arbitrage_sell_offer", "sell_offer"),
+    )
+
     # Relationships to related offers
     buy_offer_rel: Mapped["Offers"] = relationship(
         "Offers",
@@ -125,10 +152,42 @@ class Arbitrage(Base):
         back_populates="arbitrage_as_sell"
     )
 
+# Learned aliases: item names from trade messages already resolved to a catalog item
+class ItemAliases(Base):
+    __tablename__ = "item_aliases"
 
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    alias_name: Mapped[str] = mapped_column(String, nullable=False)      # normalized name from message text
+    item_grade: Mapped[str] = mapped_column(String, nullable=False)      # grade from message ('undefined' allowed)
+    item_duration: Mapped[str] = mapped_column(String, nullable=False)   # duration from message ('undefined' allowed)
+    item_id: Mapped[int] = mapped_column(ForeignKey(Items.id, ondelete="CASCADE"), nullable=False)
+    added_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc)
+    )
 
+    # One alias per name, grade and duration
+    __table_args__ = (
+        UniqueConstraint("alias_name", "item_grade", "item_duration", name="_alias_grade_duration_uc"),
+        Index("ix_item_aliases_item_id", "item_id"),
+    )
 
+# Collector progress: every in-game id up to last_in_game_id has been fetched
+class CollectorCheckpoints(Base):
+    __tablename__ = "collector_checkpoints"
 
+    item_type: Mapped[ItemType] = mapped_column(Enum(ItemType), primary_key=True)
+    last_in_game_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc)
+    )
 
+# Catalog change counter (single row): every transaction writing items takes the next
+# version and stamps the rows it writes, so workers can fetch only what changed
+class CatalogVersion(Base):
+    __tablename__ = "catalog_version"
 
-
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False)
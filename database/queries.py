@@ -1,21 +1,30 @@
 import logging
 import hashlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 
 from sqlalchemy.orm import selectinload
-from sqlalchemy.exc import IntegrityError, ProgrammingError
-from sqlalchemy import select, delete, update, text, and_
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy import select, insert, delete, update, text, and_, or_, func, literal_column, bindparam, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
+from config import settings
 from database.db_main import engine, Base, session_factory
-from database.models import Items, ItemType, Offers, OfferType, Messages, Arbitrage
+from database.migrations import run_migrations
+from metrics import timed_db_call, db_call_seconds
+from database.models import (
+    Items, ItemType, Offers, OfferType, Messages, Arbitrage, ItemAliases, CollectorCheckpoints, CatalogVersion
+)
 
 logger = logging.getLogger(__name__)
 
 
-# Database initialization
+# Database initialization (new tables from models, then pending migrations for existing ones)
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
         logger.info("Database initialized.")
+    await run_migrations()
 
 
 # Drop all tables
@@ -71,75 +80,50 @@ async def drop_arbitrage():
 
 
 # Insert data
-async def insert_item_data(data):
-    async with session_factory() as session:
-        new_item = Items(
-            in_game_id=data["in_game_id"],
-            item_name=data["item_name"],
-            item_type=ItemType(data["item_type"]),
-            item_grade=data["item_grade"],
-            item_duration=data["item_duration"]
-        )
 
-        try:
-            session.add(new_item)
-            await session.commit()
-            logger.info(f"Inserted item: {data['item_name']}")
-        except IntegrityError:
-            await session.rollback()
-            logger.warning("Integrity error while inserting item (duplicate or invalid key).")
+# Insert items in one statement; a stored item with the same name, grade and duration gets
+# the new in_game_id / type (unchanged rows are left alone). Rows must have unique keys.
+# Returns counts of inserted, updated and unchanged rows.
+@timed_db_call
+async def upsert_items(items_data):
+    async with session_factory() as session:
+        version = await next_catalog_version(session)
+
+        query = pg_insert(Items).values([
+            {
+                "in_game_id": data["in_game_id"],
+                "item_name": data["item_name"],
+                "item_type": ItemType(data["item_type"]),
+                "item_grade": data["item_grade"],
+                "item_duration": data["item_duration"],
+                "catalog_version": version
+            }
+            for data in items_data
+        ])
+        query = query.on_conflict_do_update(
+            constraint="_name_grade_duration_uc",
+            set_={
+                "in_game_id": query.excluded.in_game_id,
+                "item_type": query.excluded.item_type,
+                "catalog_version": query.excluded.catalog_version
+            },
+            where=(Items.in_game_id != query.excluded.in_game_id) | (Items.item_type != query.excluded.item_type)
+        ).returning(literal_column("xmax = 0"))  # true for inserted rows, false for updated ones
 
+        result = await session.execute(query)
+        written = result.scalars().all()
+        await session.commit()
 
-async def insert_offer_data_and_return_id(offer_data_dict):
-    async with session_factory() as session:
-        new_offer = Offers(
-            item_name_message=offer_data_dict['item_name_message'],
-            item_name_db=offer_data_dict['item_name_db'],
-            item_id=offer_data_dict['item_id'],
-            quantity=offer_data_dict['quantity'],
-            offer_type=offer_data_dict['offer_type'],
-            currency=offer_data_dict['currency'],
-            price_for_one=offer_data_dict['price_for_one'],
-            message_id=offer_data_dict['message_id'],
-        )
-        try:
-            session.add(new_offer)
-            await session.flush()
-            offer_id = new_offer.id
-            await session.commit()
-            logger.info(f"Inserted offer with id={offer_id}")
-            return offer_id
-        except IntegrityError:
-            await session.rollback()
-            logger.warning("Integrity error while inserting offer.")
-            return None
-
-
-async def insert_message_data_and_return_id(event_obj):
-    async with session_factory() as session:
-        sender = await event_obj.get_sender()
-        new_message = Messages(
-            message_group_id=event_obj.message.id,
-            sender_username=sender.username,
-            sender_id=event_obj.sender_id,
-            message_text=event_obj.raw_text,
-            message_text_hashed=hash_message(event_obj.raw_text),
-            sent_at=event_obj.date
-        )
-        try:
-            session.add(new_message)
-            await session.flush()
-            mes_id = new_message.id
-            await session.commit()
-            logger.info(f"Inserted message with id={mes_id}")
-            return mes_id
-        except IntegrityError:
-            await session.rollback()
-            logger.warning("Integrity error while inserting message.")
-            return None
+    inserted = sum(1 for is_insert in written if is_insert)
+    return {
+        "inserted": inserted,
+        "updated": len(written) - inserted,
+        "unchanged": len(items_data) - len(written)
+    }
 
 
 # Select operations
+@timed_db_call
 async def get_items():
     async with session_factory() as session:
         query = select(Items).order_by(Items.id)
@@ -147,37 +131,294 @@ async def get_items():
         logger.debug("Fetched all items from DB.")
         return result.scalars().all()
 
-# Select opposite-type offers to detect arbitrage opportunities.
-async def get_filtered_offers(offer_data_dict):
+# Number of items and their highest id (to check that a catalog snapshot matches the table)
+@timed_db_call
+async def get_items_summary():
+    async with session_factory() as session:
+        result = await session.execute(select(func.count(Items.id), func.max(Items.id)))
+        count, max_id = result.one()
+        return count, max_id
+
+
+# Catalog versions: a transaction writing items takes the next version from the catalog_version
+# row and stamps it on every row it writes. The row lock makes concurrent writers wait for each
+# other, so versions are committed in increasing order and a reader that has seen version N
+# has seen every change up to N.
+NEXT_CATALOG_VERSION_SQL = """
+    INSERT INTO catalog_version (id, version) VALUES (1, 1)
+    ON CONFLICT (id) DO UPDATE SET version = catalog_version.version + 1
+    RETURNING version
+"""
+
+
+async def next_catalog_version(session):
+    result = await session.execute(text(NEXT_CATALOG_VERSION_SQL))
+    return result.scalar_one()
+
+
+# Current catalog version (0 before the first catalog write); cheap enough to poll
+@timed_db_call
+async def get_catalog_version():
+    async with session_factory() as session:
+        result = await session.execute(select(CatalogVersion.version).where(CatalogVersion.id == 1))
+        return result.scalar() or 0
+
+
+# Items written after the given catalog version
+@timed_db_call
+async def get_items_changed_since(version):
+    async with session_factory() as session:
+        query = select(Items).where(Items.catalog_version > version).order_by(Items.id)
+        result = await session.execute(query)
+        return result.scalars().all()
+
+
+ITEMS_COPY_COLUMNS = ["id", "in_game_id", "item_name", "item_type", "item_grade", "item_duration"]
+
+
+# Bulk loads catalog rows (tuples in ITEMS_COPY_COLUMNS order, item_type as enum name) with COPY
+# into a staging table, then upserts them into items in one statement (PostgreSQL only).
+# Ids are kept when items is empty, so a snapshot of another database keeps its ids;
+# otherwise rows are matched on name, grade and duration and new ones get fresh ids.
+@timed_db_call
+async def copy_items(rows):
+    async with engine.connect() as conn:
+        raw_connection = await conn.get_raw_connection()
+        connection = raw_connection.driver_connection
+
+        async with connection.transaction():
+            await connection.execute(
+                "CREATE TEMP TABLE items_staging (LIKE items INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            await connection.copy_records_to_table("items_staging", records=rows, columns=ITEMS_COPY_COLUMNS)
+
+            version = await connection.fetchval(NEXT_CATALOG_VERSION_SQL)
+            keep_ids = not await connection.fetchval("SELECT EXISTS (SELECT 1 FROM items)")
+            columns = ITEMS_COPY_COLUMNS if keep_ids else ITEMS_COPY_COLUMNS[1:]
+            column_list = ", ".join(columns)
+            written = await connection.fetch(f"""
+                INSERT INTO items ({column_list}, catalog_version)
+                SELECT {column_list}, $1 FROM items_staging
+                ON CONFLICT ON CONSTRAINT _name_grade_duration_uc DO UPDATE
+                SET in_game_id = EXCLUDED.in_game_id, item_type = EXCLUDED.item_type,
+                    catalog_version = EXCLUDED.catalog_version
+                WHERE items.in_game_id != EXCLUDED.in_game_id OR items.item_type != EXCLUDED.item_type
+                RETURNING xmax = 0 AS inserted
+            """, version)
+
+            if keep_ids:
+                # Explicit ids don't advance the sequence
+                await connection.execute(
+                    "SELECT setval(pg_get_serial_sequence('items', 'id'), COALESCE(MAX(id), 1)) FROM items"
+                )
+
+    inserted = sum(1 for row in written if row["inserted"])
+    counts = {"inserted": inserted, "updated": len(written) - inserted, "unchanged": len(rows) - len(written)}
+    logger.info(f"Copied {len(rows)} catalog items ({'ids kept' if keep_ids else 'new ids'}): {counts}")
+    return counts
+
+
+# In-game ids of stored items by type (the collector skips them)
+@timed_db_call
+async def get_stored_in_game_ids():
+    async with session_factory() as session:
+        result = await session.execute(select(Items.item_type, Items.in_game_id))
+        stored = {item_type: set() for item_type in ItemType}
+        for item_type, in_game_id in result.all():
+            stored[item_type].add(in_game_id)
+        return stored
+
+
+@timed_db_call
+async def get_collector_checkpoints():
+    async with session_factory() as session:
+        result = await session.execute(select(CollectorCheckpoints))
+        return {checkpoint.item_type: checkpoint.last_in_game_id for checkpoint in result.scalars().all()}
+
+
+# Moves the collector checkpoint of an item type forward (never back)
+@timed_db_call
+async def save_collector_checkpoint(item_type, last_in_game_id):
+    query = pg_insert(CollectorCheckpoints).values(item_type=item_type, last_in_game_id=last_in_game_id)
+    query = query.on_conflict_do_update(
+        index_elements=[CollectorCheckpoints.item_type],
+        set_={"last_in_game_id": query.excluded.last_in_game_id, "updated_at": func.now()},
+        where=CollectorCheckpoints.last_in_game_id < query.excluded.last_in_game_id
+    )
+
+    async with session_factory() as session:
+        await session.execute(query)
+        await session.commit()
+        logger.debug(f"Collector checkpoint {item_type.value}: {last_in_game_id}")
+
+
+# Hashes of all stored messages (used to warm the duplicate filter)
+@timed_db_call
+async def get_message_hashes():
+    async with session_factory() as session:
+        result = await session.execute(select(Messages.message_text_hashed))
+        logger.debug("Fetched all message hashes from DB.")
+        return result.scalars().all()
+
+
+@timed_db_call
+async def get_item_aliases():
+    async with session_factory() as session:
+        result = await session.execute(select(ItemAliases))
+        logger.debug("Fetched all item aliases from DB.")
+        return result.scalars().all()
+
+# Offers of messages last seen (sent or reposted) before this moment are too old for arbitrage search.
+def freshness_cutoff():
+    return datetime.now(timezone.utc) - timedelta(hours=settings.offer_freshness_hours)
+
+
+# When a message was last posted: its latest repost, or the message itself
+message_seen_at = func.coalesce(Messages.last_seen_at, Messages.sent_at)
+
+
+# Select fresh buy/sell offers with their message's hash and last seen date
+# (used to load the in-memory order book).
+@timed_db_call
+async def get_open_offers():
+    query = (
+        select(Offers, Messages.message_text_hashed, message_seen_at)
+        .join(Messages, Offers.message_id == Messages.id)
+        .filter(and_(
+            Offers.offer_type.in_([OfferType.BUY, OfferType.SELL]),
+            message_seen_at >= freshness_cutoff()
+        ))
+    )
+
+    async with session_factory() as session:
+        result = await session.execute(query)
+        logger.debug("Fetched open offers for order book.")
+        return result.all()
+
+# Arbitrage ids with their offer ids (used to load open arbitrages into the order book).
+@timed_db_call
+async def get_arbitrage_offer_pairs():
+    async with session_factory() as session:
+        result = await session.execute(select(Arbitrage.id, Arbitrage.buy_offer, Arbitrage.sell_offer))
+        logger.debug("Fetched arbitrage offer pairs.")
+        return result.all()
+
+# Select fresh opposite-type offers to detect arbitrage opportunities.
+def filtered_offers_query(offer_data_dict):
     query_for_buy = (
         select(Offers)
+        .join(Messages, Offers.message_id == Messages.id)
         .filter(and_(
             Offers.item_id == offer_data_dict['item_id'],
             Offers.currency == offer_data_dict['currency'],
             Offers.price_for_one < offer_data_dict['price_for_one'],
-            Offers.offer_type == OfferType.SELL
+            Offers.offer_type == OfferType.SELL,
+            message_seen_at >= freshness_cutoff()
         ))
     )
 
     query_for_sell = (
         select(Offers)
+        .join(Messages, Offers.message_id == Messages.id)
         .filter(and_(
             Offers.item_id == offer_data_dict['item_id'],
             Offers.currency == offer_data_dict['currency'],
             Offers.price_for_one > offer_data_dict['price_for_one'],
-            Offers.offer_type == OfferType.BUY
+            Offers.offer_type == OfferType.BUY,
+            message_seen_at >= freshness_cutoff()
         ))
     )
 
-    query = query_for_sell if offer_data_dict['offer_type'] == OfferType.SELL else query_for_buy
+    return query_for_sell if offer_data_dict['offer_type'] == OfferType.SELL else query_for_buy
+
+
+# Unit of work for one trade message: the message, its offers and the arbitrage rows
+# they create are written in one transaction with a single commit.
+# Each add_* call flushes and returns the generated IDs.
+class TradeMessageUnit:
+
+    def __init__(self, session):
+        self.session = session
+
+    @timed_db_call
+    async def add_message(self, event_obj, sender):
+        new_message = build_message(event_obj, sender)
+        self.session.add(new_message)
+        await self.session.flush()
+        return new_message.id
+
+    @timed_db_call
+    async def add_offers(self, offers_data):
+        new_offers = [build_offer(offer_data_dict) for offer_data_dict in offers_data]
+        self.session.add_all(new_offers)
+        await self.session.flush()
+        return [offer.id for offer in new_offers]
+
+    # Aliases learned while matching the message, in one multi-row upsert
+    @timed_db_call
+    async def add_aliases(self, aliases):
+        if not aliases:
+            return
+
+        query = pg_insert(ItemAliases).values(aliases)
+        await self.session.execute(query.on_conflict_do_update(
+            index_elements=["alias_name", "item_grade", "item_duration"],
+            set_={"item_id": query.excluded.item_id}
+        ))
+        logger.debug(f"Saved {len(aliases)} item aliases")
+
+    # All rows go in one multi-row INSERT ... RETURNING, ids come back in pair order
+    @timed_db_call
+    async def add_arbitrages(self, offer_pairs):
+        if not offer_pairs:
+            return []
+
+        rows = [arbitrage_values(buy_offer, sell_offer) for buy_offer, sell_offer in offer_pairs]
+        result = await self.session.execute(
+            insert(Arbitrage).returning(Arbitrage.id, sort_by_parameter_order=True),
+            rows
+        )
+        return list(result.scalars().all())
+
 
+# Opens TradeMessageUnit; commits when the block exits, rolls everything back on error.
+@asynccontextmanager
+async def trade_message_transaction():
     async with session_factory() as session:
-        result = await session.execute(query)
-        logger.debug("Fetched filtered offers for arbitrage check.")
-        return result.scalars().all()
+        async with session.begin() as transaction:
+            yield TradeMessageUnit(session)
+            with db_call_seconds.time(call="commit_trade_message"):
+                await transaction.commit()
+        logger.debug("Trade message transaction committed.")
+
+
+# Build ORM objects
+def build_message(event_obj, sender):
+    return Messages(
+        message_group_id=event_obj.message.id,
+        sender_username=sender.username,
+        sender_id=event_obj.sender_id,
+        message_text=event_obj.raw_text,
+        message_text_hashed=hash_message(event_obj.raw_text),
+        sent_at=event_obj.date
+    )
 
-# Insert new arbitrage record based on two offers.
-async def insert_arbitrage_data(buy_offer, sell_offer):
+
+def build_offer(offer_data_dict):
+    return Offers(
+        item_name_message=offer_data_dict['item_name_message'],
+        item_name_db=offer_data_dict['item_name_db'],
+        item_id=offer_data_dict['item_id'],
+        quantity=offer_data_dict['quantity'],
+        offer_type=offer_data_dict['offer_type'],
+        currency=offer_data_dict['currency'],
+        price_for_one=offer_data_dict['price_for_one'],
+        message_id=offer_data_dict['message_id'],
+    )
+
+
+# Arbitrage column values based on two offers.
+def arbitrage_values(buy_offer, sell_offer):
     profit_for_one = buy_offer['price_for_one'] - sell_offer['price_for_one']
 
     if sell_offer['quantity'] and buy_offer['quantity']:
@@ -187,32 +428,90 @@ async def insert_arbitrage_data(buy_offer, sell_offer):
     else:
         quantity = profit_for_all = price_for_all = None
 
+    return {
+        "item_name": buy_offer['item_name'],
+        "buy_offer": buy_offer['id'],
+        "sell_offer": sell_offer['id'],
+        "currency": sell_offer['currency'],
+        "profit_for_one": profit_for_one,
+        "profit_for_all": profit_for_all,
+        "price_for_one": sell_offer['price_for_one'],
+        "price_for_all": price_for_all,
+        "quantity": quantity
+    }
+
+
+# Writes the dates of the latest reposts ({message_id: date}) to messages.last_seen_at
+# in one statement; sent_at keeps the date of the original message.
+@timed_db_call
+async def save_message_reposts(reposts):
+    messages = Messages.__table__
+    query = (
+        update(messages)
+        .where(and_(
+            messages.c.id == bindparam("message_id"),
+            or_(messages.c.last_seen_at.is_(None), messages.c.last_seen_at < bindparam("seen_at"))
+        ))
+        .values(last_seen_at=bindparam("seen_at"))
+    )
+
     async with session_factory() as session:
-        new_arbitrage = Arbitrage(
-            item_name=buy_offer['item_name'],
-            buy_offer=buy_offer['id'],
-            sell_offer=sell_offer['id'],
-            currency=sell_offer['currency'],
-            profit_for_one=profit_for_one,
-            profit_for_all=profit_for_all,
-            price_for_one=sell_offer['price_for_one'],
-            price_for_all=price_for_all,
-            quantity=quantity
+        await session.execute(
+            query, [{"message_id": message_id, "seen_at": seen_at} for message_id, seen_at in reposts.items()]
         )
-        try:
-            session.add(new_arbitrage)
-            await session.flush()
-            new_id = new_arbitrage.id
-            await session.commit()
-            logger.info(f"Inserted arbitrage with id={new_id}")
-            return new_id
-        except IntegrityError:
-            await session.rollback()
-            logger.warning("Integrity error while inserting arbitrage.")
-
-
-# Fetch arbitrage data with related offers, items and messages.
-async def get_arbitrage_message_item_data_for_bot(arbitrage_id):
+        await session.commit()
+        logger.debug(f"Saved repost dates of {len(reposts)} messages")
+
+
+# DELETE ... RETURNING moved into the table's archive copy, with explicit column lists
+def archive_statement(table, where):
+    columns = ", ".join(column.name for column in table.columns)
+    return (
+        f"WITH moved AS (DELETE FROM {table.name} WHERE {where} RETURNING {columns}) "
+        f"INSERT INTO {table.name}_archive ({columns}) SELECT {columns} FROM moved"
+    )
+
+
+# Moves up to batch_size messages last seen before cutoff, with their offers and arbitrage
+# records, to the *_archive tables in one short transaction (PostgreSQL only).
+# A repost is never older than its message, so the sent_at index still narrows the scan.
+# Returns hashes of the archived messages and moved row counts per table.
+@timed_db_call
+async def archive_expired_messages(cutoff, batch_size):
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            text(
+                "SELECT id FROM messages WHERE sent_at < :cutoff "
+                "AND (last_seen_at IS NULL OR last_seen_at < :cutoff) "
+                "ORDER BY sent_at LIMIT :batch_size FOR UPDATE SKIP LOCKED"
+            ),
+            {"cutoff": cutoff, "batch_size": batch_size}
+        )
+        message_ids = result.scalars().all()
+        if not message_ids:
+            return [], {}
+
+        params = {"message_ids": message_ids}
+        expired_offers = "SELECT id FROM offers WHERE message_id = ANY(:message_ids)"
+        arbitrage = await conn.execute(text(archive_statement(
+            Arbitrage.__table__, f"buy_offer IN ({expired_offers}) OR sell_offer IN ({expired_offers})"
+        )), params)
+        offers = await conn.execute(text(archive_statement(
+            Offers.__table__, "message_id = ANY(:message_ids)"
+        )), params)
+        messages = await conn.execute(text(
+            archive_statement(Messages.__table__, "id = ANY(:message_ids)") + " RETURNING message_text_hashed"
+        ), params)
+        message_hashes = messages.scalars().all()
+
+    counts = {"messages": len(message_hashes), "offers": offers.rowcount, "arbitrage": arbitrage.rowcount}
+    logger.debug(f"Archived {counts}")
+    return message_hashes, counts
+
+
+# Fetch arbitrage records with related offers, items and messages in one query (ordered by id).
+@timed_db_call
+async def get_arbitrages_data_for_bot(arbitrage_ids):
     query = (
         select(Arbitrage)
         .options(
@@ -221,17 +520,18 @@ async def get_arbitrage_message_item_data_for_bot(arbitrage_id):
             selectinload(Arbitrage.sell_offer_rel).selectinload(Offers.item),
             selectinload(Arbitrage.sell_offer_rel).selectinload(Offers.message)
         )
-        .filter(Arbitrage.id == arbitrage_id)
+        .filter(Arbitrage.id.in_(arbitrage_ids))
+        .order_by(Arbitrage.id)
     )
 
     async with session_factory() as session:
         result = await session.execute(query)
-        logger.debug(f"Fetched arbitrage data for id={arbitrage_id}")
-        result = result.scalars().all()
-    return result[0]
+        logger.debug(f"Fetched arbitrage data for ids={arbitrage_ids}")
+        return result.scalars().all()
 
 
 # Update / Delete
+@timed_db_call
 async def delete_offer_by_id(offer_id):
     async with session_factory() as session:
         query = delete(Offers).where(Offers.id == offer_id)
@@ -240,6 +540,27 @@ async def delete_offer_by_id(offer_id):
         logger.info(f"Deleted offer id={offer_id}")
 
 
+# Deletes aliases with the given (grade, duration) pairs
+@timed_db_call
+async def delete_item_aliases_for(grade_durations):
+    async with session_factory() as session:
+        query = delete(ItemAliases).where(
+            tuple_(ItemAliases.item_grade, ItemAliases.item_duration).in_(list(grade_durations))
+        )
+        result = await session.execute(query)
+        await session.commit()
+        logger.info(f"Deleted {result.rowcount} item aliases.")
+
+
+@timed_db_call
+async def clear_item_aliases():
+    async with session_factory() as session:
+        await session.execute(delete(ItemAliases))
+        await session.commit()
+        logger.info("All item aliases cleared.")
+
+
+@timed_db_call
 async def update_quantity_in_offer_by_id(offer_id, new_quantity):
     async with session_factory() as session:
         query = (
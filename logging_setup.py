@@ -0,0 +1,102 @@
+import atexit
+import json
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from config import settings
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+DEFAULT_LEVELS = {"dev": "DEBUG", "production": "INFO"}
+
+
+# One JSON object per line: time, level, logger, message (and exception traceback)
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# Lets one warning per call site through every `interval` seconds; the next one that passes
+# tells how many were dropped. Only warnings logged with extra={"repetitive": True} (e.g.
+# "No match found" for every unknown item name) are limited, other records always pass.
+class RateLimitFilter(logging.Filter):
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.logged_at = {}
+        self.suppressed = {}
+
+    def filter(self, record):
+        if record.levelno != logging.WARNING or not getattr(record, "repetitive", False):
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        logged_at = self.logged_at.get(key)
+        if logged_at is not None and now - logged_at < self.interval:
+            self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            return False
+
+        self.logged_at[key] = now
+        suppressed = self.suppressed.pop(key, 0)
+        if suppressed:
+            record.msg = f"{record.getMessage()} (+{suppressed} similar warnings suppressed)"
+            record.args = None
+        return True
+
+
+# "sqlalchemy.engine=WARNING,telethon=INFO" -> {"sqlalchemy.engine": "WARNING", "telethon": "INFO"}
+def parse_module_levels(value):
+    levels = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        name, separator, level = entry.partition("=")
+        if not separator or not name.strip():
+            raise ValueError(f"Invalid LOG_LEVELS entry: {entry!r} (expected module=LEVEL)")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+# Root logging for the selected LOG_PROFILE:
+#   dev        - DEBUG, records written to stderr directly by the code that logs them
+#   production - INFO, records formatted by the caller and handed to a queue; a background
+#                thread writes them, so log I/O never blocks the event loop; repetitive
+#                warnings are rate limited
+def setup_logging():
+    if settings.log_profile not in DEFAULT_LEVELS:
+        raise ValueError(f"Unknown LOG_PROFILE: {settings.log_profile}")
+
+    console = logging.StreamHandler()
+    if settings.log_profile == "production":
+        log_queue = queue.SimpleQueue()
+        handler = QueueHandler(log_queue)
+        listener = QueueListener(log_queue, console, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)  # writes out what's still queued on exit
+    else:
+        handler = console
+
+    handler.setFormatter(JsonFormatter() if settings.log_format == "json" else logging.Formatter(LOG_FORMAT))
+    if settings.log_profile == "production" and settings.log_rate_limit > 0:
+        handler.addFilter(RateLimitFilter(settings.log_rate_limit))
+
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+    root.setLevel((settings.log_level or DEFAULT_LEVELS[settings.log_profile]).upper())
+
+    for name, level in parse_module_levels(settings.log_levels).items():
+        logging.getLogger(name).setLevel(level)
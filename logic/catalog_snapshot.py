@@ -0,0 +1,111 @@
+import gzip
+import json
+import logging
+from datetime import datetime, timezone
+
+from config import settings
+from database.models import Items, ItemType
+from database.queries import init_db, get_items, get_items_summary, copy_items
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = "trade-client-catalog"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_COLUMNS = ["id", "in_game_id", "item_name", "item_type", "item_grade", "item_duration"]
+
+
+# Snapshot file: gzipped JSON with a versioned header and one compact row per item
+# (values in SNAPSHOT_COLUMNS order, item_type as its value, e.g. "equipment")
+def write_snapshot(path, items_in_db):
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "columns": SNAPSHOT_COLUMNS,
+        "items": [
+            [item.id, item.in_game_id, item.item_name, item.item_type.value, item.item_grade, item.item_duration]
+            for item in items_in_db
+        ]
+    }
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        json.dump(snapshot, file, ensure_ascii=False, separators=(",", ":"))
+
+
+def read_snapshot(path):
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        snapshot = json.load(file)
+
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is not a catalog snapshot")
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported catalog snapshot version {snapshot.get('version')} in {path}")
+    if snapshot.get("columns") != SNAPSHOT_COLUMNS:
+        raise ValueError(f"Unexpected catalog snapshot columns in {path}: {snapshot.get('columns')}")
+
+    return snapshot["items"]
+
+
+# Transient Items objects (not attached to a session) for the matcher
+def snapshot_items(rows):
+    return [
+        Items(
+            id=item_id, in_game_id=in_game_id, item_name=item_name,
+            item_type=ItemType(item_type), item_grade=item_grade, item_duration=item_duration
+        )
+        for item_id, in_game_id, item_name, item_type, item_grade, item_duration in rows
+    ]
+
+
+# APP_MODE=catalog_export: writes the items table to CATALOG_SNAPSHOT_PATH
+async def export_catalog():
+    await init_db()
+    items_in_db = await get_items()
+    write_snapshot(settings.catalog_snapshot_path, items_in_db)
+    logger.info(f"Exported {len(items_in_db)} items to {settings.catalog_snapshot_path}")
+
+
+# APP_MODE=catalog_import: loads CATALOG_SNAPSHOT_PATH into the items table
+async def import_catalog():
+    await init_db()
+    rows = read_snapshot(settings.catalog_snapshot_path)
+    await copy_rows(rows)
+
+
+async def copy_rows(rows):
+    # Enum columns are stored by name
+    records = [
+        (item_id, in_game_id, item_name, ItemType(item_type).name, item_grade, item_duration)
+        for item_id, in_game_id, item_name, item_type, item_grade, item_duration in rows
+    ]
+    return await copy_items(records)
+
+
+# Catalog for the worker's matcher. With WORKER_CATALOG_FROM_SNAPSHOT the snapshot is used
+# directly (and imported first into an empty items table) as long as it matches the table;
+# otherwise items are read from the database.
+async def load_worker_catalog():
+    if not settings.worker_catalog_from_snapshot:
+        return await get_items()
+
+    try:
+        rows = read_snapshot(settings.catalog_snapshot_path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Catalog snapshot not usable ({e}) — loading items from database")
+        return await get_items()
+
+    count, max_id = await get_items_summary()
+    if count == 0:
+        logger.info(f"Items table is empty — importing {len(rows)} items from {settings.catalog_snapshot_path}")
+        await copy_rows(rows)
+        count, max_id = await get_items_summary()
+
+    # Offers reference items by id, so the snapshot is only used when its ids are the table's
+    if count != len(rows) or max_id != max((row[0] for row in rows), default=None):
+        logger.warning(
+            f"Catalog snapshot ({len(rows)} items) doesn't match items table ({count} items) "
+            f"— loading items from database"
+        )
+        return await get_items()
+
+    logger.info(f"Catalog loaded from snapshot {settings.catalog_snapshot_path}")
+    return snapshot_items(rows)
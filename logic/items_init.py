@@ -1,29 +1,27 @@
 import logging
 import asyncio
 from config import settings
-from collections import deque
 
-from database.queries import init_db, clear_db
+from database.queries import init_db
 from telegram.items_info_listener import items_listener
-from logic.items_initialization.commands_printer import items_info_command_printer
+from logic.items_initialization.commands_printer import create_items_collector
 from telegram.tg_client import start_client, run_client_forever
 
 logger = logging.getLogger(__name__)
 
-# Renews table 'Items' in db, by printing commands and analyzing answers from game_info_bot
+# Renews table 'Items' in db, by printing commands and analyzing answers from game_info_bot.
+# Resumes from the stored checkpoints; offers and arbitrage history are kept.
 async def items_in_file_renew():
 
     logger.info("Items data renewal in database started")
 
-    await clear_db()
     await init_db()
 
-    items_type_and_id_queue = deque(maxlen=1)
-    async_flag = asyncio.Event()
+    collector = await create_items_collector(settings.collector_force_refresh)
     # await init_db()
     await start_client()
-    await items_listener(items_type_and_id_queue, async_flag)
-    asyncio.create_task(items_info_command_printer(items_type_and_id_queue, async_flag))
+    await items_listener(collector)
+    asyncio.create_task(collector.run())
     await run_client_forever()
 
 
@@ -1,8 +1,12 @@
 import asyncio
 import logging
-from datetime import datetime, timezone
+import time
+from collections import deque
 
 from config import settings
+from database.models import ItemType
+from database.queries import get_stored_in_game_ids, get_collector_checkpoints, save_collector_checkpoint
+from logic.items_initialization.items_buffer import ItemsBuffer
 from telegram.tg_client import client
 
 logger = logging.getLogger(__name__)
@@ -13,54 +17,253 @@ commands = [
     ("/getasset", settings.resource_last_id, "resource")
 ]
 
-# Sends item info commands to telegram game_info_bot in sequence, handling rate limits and retries.
-async def items_info_command_printer(items_type_and_id_queue, async_flag):
 
-    logger.info("Starting item info command printer...")
+# First in-game id to fetch per item type: past the checkpoint, or past the highest
+# stored id for a catalog collected before checkpoints existed
+def start_ids(stored_ids, checkpoints):
+    return {
+        item_type: checkpoints.get(item_type, max(stored_ids[item_type], default=-1)) + 1
+        for item_type in ItemType
+    }
 
+
+# One request per in-game id to fetch: everything when refresh is forced,
+# otherwise ids past the start that are not stored yet
+def build_requests(stored_ids, checkpoints, force_refresh):
+    starts = start_ids(stored_ids, checkpoints)
+    requests = []
     for cmd, limit, item_type in commands:
-        logger.info(f"Processing command {cmd} up to ID {limit}")
+        item_type_enum = ItemType(item_type)
+        first_id = 0 if force_refresh else starts[item_type_enum]
+        requests += [
+            {"cmd": cmd, "type": item_type, "in_game_id": item_id, "attempts": 0}
+            for item_id in range(first_id, limit + 1)
+            if force_refresh or item_id not in stored_ids[item_type_enum]
+        ]
+    return requests
+
+
+# Additive-increase / multiplicative-decrease send rate (requests per second):
+# every answered request raises the rate a little, a rate-limit reply or a timeout halves it.
+# Signals from requests sent before the last decrease are ignored, so one burst of
+# rate-limit replies cuts the rate once.
+class AimdRate:
+
+    def __init__(self, rate, min_rate, max_rate, increase=0.1, decrease=0.5):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.decreased_at = 0.0
+
+    @property
+    def interval(self):
+        return 1 / self.rate
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_congestion(self, sent_at):
+        if sent_at < self.decreased_at:
+            return
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.decreased_at = time.monotonic()
+        logger.info(f"Send rate lowered to {self.rate:.2f} req/s")
+
+
+# Sends item info commands to game_info_bot with up to `window` requests in flight.
+# Replies are matched to requests by the id of the message they answer. A bot that
+# doesn't reply to messages can only be matched by order, so the first such reply
+# shrinks the window to one request (a lost reply would shift every later match).
+class ItemsCollector:
+
+    def __init__(self, requests, window, rate, timeout, max_attempts):
+        self.pending = deque(requests)
+        self.in_flight = {}
+        self.window = window
+        self.rate = rate
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.changed = asyncio.Event()
+        self.last_sent = 0.0
+
+        self.total = len(self.pending)
+        self.outcomes = {"item": 0, "not_found": 0, "unparsed": 0, "failed": 0}
+        self.retries = 0
+
+        self.buffer = ItemsBuffer(settings.collector_flush_size, settings.collector_flush_interval, self.items_stored)
+
+        # Checkpoint per type: ids below the lowest request that is unanswered (given-up ones
+        # included) or whose item is not written yet
+        self.limits = {ItemType(item_type): limit for _, limit, item_type in commands}
+        self.open_ids = {item_type: set() for item_type in ItemType}
+        for request in self.pending:
+            self.open_ids[ItemType(request["type"])].add(request["in_game_id"])
+        self.saved_checkpoints = {}
+
+    @property
+    def done(self):
+        return sum(self.outcomes.values())
+
+    async def run(self):
+        logger.info(f"Starting items collector: {self.total} requests, window {self.window}")
+        started = time.monotonic()
+        monitor = asyncio.create_task(self.progress_monitor())
+        flusher = asyncio.create_task(self.buffer.run())
+
+        try:
+            while self.pending or self.in_flight:
+                self.expire_timeouts()
+
+                if not self.pending or len(self.in_flight) >= self.window:
+                    await self.wait_for_change(1)
+                    continue
 
-        for item_id in range(limit + 1):
-            # add current task to queue
-            items_type_and_id_queue.append({
-                "type": item_type,
-                "in_game_id": item_id,
-                "datetime": datetime.now(timezone.utc)
-            })
+                delay = self.last_sent + self.rate.interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
 
-            await client.send_message(settings.items_info_group_id, f"{cmd} {item_id}")
-            await asyncio.sleep(1)
+                await self.send(self.pending.popleft())
+        finally:
+            # Also on shutdown: buffered items are written and the checkpoint saved
+            monitor.cancel()
+            flusher.cancel()
+            await self.buffer.flush()
+            await self.save_checkpoints()
 
-            # wait for response signal
-            while True:
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Items collector finished in {elapsed:.0f}s: {self.outcomes}, {self.retries} retries "
+            f"({self.done / elapsed if elapsed else 0:.2f} req/s), writes {self.buffer.stats}"
+        )
+
+    async def wait_for_change(self, timeout):
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.changed.clear()
+
+    async def send(self, request):
+        request["attempts"] += 1
+        self.last_sent = time.monotonic()
+        try:
+            message = await client.send_message(
+                settings.items_info_group_id, f"{request['cmd']} {request['in_game_id']}"
+            )
+        except Exception as e:
+            logger.warning(f"Failed to send {request['cmd']} {request['in_game_id']}: {e}")
+            self.retry(request, "send error")
+            return
+
+        request["sent_at"] = time.monotonic()
+        self.in_flight[message.id] = request
+
+    # Request answered by the bot's message (None if it answers nothing in flight)
+    def match_reply(self, event):
+        reply_to = event.message.reply_to_msg_id
+        if reply_to is not None:
+            # Unknown id: a late reply to a request that already timed out and was re-sent
+            return self.in_flight.pop(reply_to, None)
+
+        if self.window > 1:
+            logger.warning("Bot replies are not linked to requests — matching by order, one request at a time")
+            self.window = 1
+
+        if not self.in_flight:
+            return None
+        oldest = next(iter(self.in_flight))
+        return self.in_flight.pop(oldest)
+
+    def complete(self, request, outcome):
+        # Parsed items stay open for the checkpoint until the buffer writes them
+        if outcome != "item":
+            self.open_ids[ItemType(request["type"])].discard(request["in_game_id"])
+        self.outcomes[outcome] += 1
+        self.rate.on_success()
+        self.changed.set()
+
+    # Parsed item goes to the write buffer
+    def store_item(self, request, data_dict):
+        self.buffer.add(data_dict, request)
+        self.complete(request, "item")
+
+    async def items_stored(self, requests):
+        for request in requests:
+            self.open_ids[ItemType(request["type"])].discard(request["in_game_id"])
+        await self.save_checkpoints()
+
+    def retry(self, request, reason):
+        if reason != "send error":
+            self.rate.on_congestion(request.get("sent_at", 0.0))
+
+        if request["attempts"] >= self.max_attempts:
+            logger.error(f"Giving up on {request['cmd']} {request['in_game_id']} after {request['attempts']} attempts")
+            self.outcomes["failed"] += 1
+        else:
+            logger.debug(f"Retrying {request['cmd']} {request['in_game_id']} ({reason})")
+            self.retries += 1
+            self.pending.appendleft(request)
+        self.changed.set()
+
+    def expire_timeouts(self):
+        now = time.monotonic()
+        expired = [
+            message_id for message_id, request in self.in_flight.items()
+            if now - request["sent_at"] > self.timeout
+        ]
+        for message_id in expired:
+            request = self.in_flight.pop(message_id)
+            logger.warning(f"Timeout for {request['cmd']} {request['in_game_id']}")
+            self.retry(request, "timeout")
+
+    # Logs progress, throughput and ETA
+    async def progress_monitor(self):
+        previous_done, previous_time = self.done, time.monotonic()
+        while True:
+            await asyncio.sleep(settings.collector_progress_interval)
+            now = time.monotonic()
+            throughput = (self.done - previous_done) / (now - previous_time)
+            remaining = self.total - self.done
+            eta = f"{remaining / throughput / 60:.0f} min" if throughput else "unknown"
+            logger.info(
+                f"Collector progress {self.done}/{self.total} ({self.done / self.total:.0%}): "
+                f"{throughput:.2f} req/s, send rate {self.rate.rate:.2f} req/s, "
+                f"{len(self.in_flight)} in flight, {self.retries} retries, ETA {eta}"
+            )
+            previous_done, previous_time = self.done, now
+            await self.save_checkpoints()
+
+    def checkpoint(self, item_type):
+        open_ids = self.open_ids[item_type]
+        return min(open_ids) - 1 if open_ids else self.limits[item_type]
+
+    async def save_checkpoints(self):
+        for item_type in ItemType:
+            checkpoint = self.checkpoint(item_type)
+            if checkpoint >= 0 and checkpoint != self.saved_checkpoints.get(item_type):
                 try:
-                    await asyncio.wait_for(async_flag.wait(), timeout=60)
-                    async_flag.clear()
-
-                    if len(items_type_and_id_queue) != 0:
-                        await asyncio.sleep(20)
-                        items_type_and_id_queue.pop()
-                        items_type_and_id_queue.append({
-                            "type": item_type,
-                            "in_game_id": item_id,
-                            "datetime": datetime.now(timezone.utc)
-                        })
-                        await client.send_message(settings.items_info_group_id, f"{cmd} {item_id}")
-                    else:
-                        break
-
-                except asyncio.TimeoutError:
-                    logger.warning(f"Timeout for {cmd} {item_id}, retrying...")
-                    if len(items_type_and_id_queue) != 0:
-                        logger.debug(f"Queue size before pop: {len(items_type_and_id_queue)}")
-                        items_type_and_id_queue.pop()
-
-                    items_type_and_id_queue.append({
-                        "type": item_type,
-                        "in_game_id": item_id,
-                        "datetime": datetime.now(timezone.utc)
-                    })
-                    await client.send_message(settings.items_info_group_id, f"{cmd} {item_id}")
-
-    logger.info("Item info command printer finished.")
\ No newline at end of file
+                    await save_collector_checkpoint(item_type, checkpoint)
+                    self.saved_checkpoints[item_type] = checkpoint
+                except Exception as e:
+                    logger.error(f"Failed to save collector checkpoint for {item_type.value}: {e}")
+
+
+async def create_items_collector(force_refresh=False):
+    stored_ids = await get_stored_in_game_ids()
+    checkpoints = await get_collector_checkpoints()
+    requests = build_requests(stored_ids, checkpoints, force_refresh)
+    logger.info(
+        f"Collector {'refresh of all ids' if force_refresh else 'resumes'}: "
+        f"{sum(len(ids) for ids in stored_ids.values())} items stored, checkpoints "
+        f"{ {item_type.value: last_id for item_type, last_id in checkpoints.items()} }, {len(requests)} ids to fetch"
+    )
+    return ItemsCollector(
+        requests,
+        window=settings.collector_window,
+        rate=AimdRate(settings.collector_rate, min_rate=0.05, max_rate=settings.collector_max_rate),
+        timeout=settings.collector_timeout,
+        max_attempts=settings.collector_max_attempts
+    )
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+
+from database.queries import upsert_items
+
+logger = logging.getLogger(__name__)
+
+
+# Collects parsed catalog items and writes them with one multi-row upsert per flush.
+# Flushes when max_size distinct items are buffered, every max_delay seconds and on shutdown.
+# on_flush receives the collector requests whose items were written.
+class ItemsBuffer:
+
+    def __init__(self, max_size, max_delay, on_flush):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.on_flush = on_flush
+        self.rows = {}
+        self.requests = []
+        self.lock = asyncio.Lock()
+        self.flush_tasks = set()
+        self.stats = {"flushes": 0, "rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0}
+
+    # Buffers item; the same name, grade and duration twice in a batch keeps the last reply
+    def add(self, data_dict, request):
+        key = (data_dict["item_name"], data_dict["item_grade"], data_dict["item_duration"])
+        if key in self.rows:
+            self.stats["duplicates"] += 1
+        self.rows[key] = data_dict
+        self.requests.append(request)
+
+        if len(self.rows) >= self.max_size:
+            task = asyncio.create_task(self.flush())
+            self.flush_tasks.add(task)
+            task.add_done_callback(self.flush_tasks.discard)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.max_delay)
+            await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            if not self.rows:
+                return
+            rows, requests = list(self.rows.values()), self.requests
+            self.rows, self.requests = {}, []
+
+            try:
+                counts = await upsert_items(rows)
+            except Exception as e:
+                # Requests stay unanswered for the checkpoint, so the next run fetches them again
+                logger.error(f"Failed to write {len(rows)} items: {e}")
+                return
+
+            self.stats["flushes"] += 1
+            self.stats["rows"] += len(rows)
+            for key, count in counts.items():
+                self.stats[key] += count
+            logger.info(
+                f"Flushed {len(rows)} items: {counts['inserted']} inserted, {counts['updated']} updated, "
+                f"{counts['unchanged']} unchanged"
+            )
+
+        await self.on_flush(requests)
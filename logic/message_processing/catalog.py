@@ -0,0 +1,76 @@
+import asyncio
+import logging
+
+from config import settings
+from database.queries import get_catalog_version, get_items_changed_since, get_items_summary, clear_item_aliases
+from logic.catalog_snapshot import load_worker_catalog
+from logic.message_processing.items_aliases import alias_resolver
+from logic.message_processing.items_matcher import ItemsMatcher
+from logic.message_processing.order_book import order_book
+
+logger = logging.getLogger(__name__)
+
+
+# Item catalog of the running worker. Workers read `matcher` once per message; a reload
+# builds a new matcher from the items written since the last known catalog version and
+# replaces the reference, so messages in progress finish with the matcher they started with.
+class Catalog:
+
+    def __init__(self):
+        self.matcher = None
+        self.version = 0
+
+    async def load(self):
+        # Version first: changes committed while items load are fetched again by the next reload
+        self.version = await get_catalog_version()
+        items_in_db = await load_worker_catalog()
+        logger.info(f"Loaded {len(items_in_db)} catalog items (catalog version {self.version})")
+        self.matcher = ItemsMatcher(items_in_db)
+        order_book.set_catalog(items_in_db)
+
+    # Applies catalog changes, if any; returns the number of changed items
+    async def reload(self):
+        version = await get_catalog_version()
+        count, _ = await get_items_summary()
+        if version < self.version or count < len(self.matcher):
+            logger.warning(
+                f"Catalog was rebuilt (version {self.version} → {version}, "
+                f"{len(self.matcher)} → {count} items), loading it from scratch"
+            )
+            return await self.rebuild()
+        if version == self.version:
+            return 0
+
+        changed = await get_items_changed_since(self.version)
+        if changed:
+            # Built off the event loop, message processing goes on meanwhile
+            matcher = await asyncio.to_thread(self.matcher.with_items, changed)
+            self.matcher = matcher
+            order_book.set_catalog(matcher.items)
+            await alias_resolver.invalidate_for_items(changed)
+
+        self.version = max([version] + [item.catalog_version for item in changed])
+        logger.info(f"Catalog reloaded to version {self.version}: {len(changed)} items added or changed")
+        return len(changed)
+
+    # The catalog was dropped and is being collected again (clear_db): item ids start over and
+    # may now belong to other items. The matcher is built from scratch and learned aliases are
+    # forgotten, in the table too (this worker may have saved some with reused ids meanwhile).
+    async def rebuild(self):
+        await clear_item_aliases()
+        alias_resolver.invalidate()
+        await self.load()
+        return len(self.matcher)
+
+
+catalog = Catalog()
+
+
+# Polls the catalog version and applies changes written by a collector run
+async def catalog_reload_worker():
+    while True:
+        await asyncio.sleep(settings.catalog_reload_interval)
+        try:
+            await catalog.reload()
+        except Exception as e:
+            logger.exception(f"Catalog reload failed: {e}")
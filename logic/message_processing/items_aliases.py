@@ -0,0 +1,98 @@
+import logging
+import re
+
+from database.queries import get_item_aliases, delete_item_aliases_for
+
+logger = logging.getLogger(__name__)
+
+whitespace_pattern = re.compile(r"\s+")
+
+
+# Normalizes item name from message text for alias lookup
+def normalize_alias_name(name: str) -> str:
+    return whitespace_pattern.sub(" ", name.strip().lower()).replace("ё", "е")
+
+
+# In-memory copy of the item_aliases table: (name, grade, duration) → item id.
+# Repeat names from trade messages resolve here without fuzzy matching.
+class AliasResolver:
+
+    def __init__(self):
+        self.aliases = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def alias_key(entry):
+        return normalize_alias_name(entry['item_name']), entry['item_grade'], entry['item_duration']
+
+    # Loads all learned aliases from DB (called once at worker start)
+    async def load(self):
+        rows = await get_item_aliases()
+        self.aliases = {
+            (row.alias_name, row.item_grade, row.item_duration): row.item_id
+            for row in rows
+        }
+        logger.info(f"Loaded {len(self.aliases)} item aliases from database")
+
+    # Returns item id for a known alias, or None
+    def resolve(self, entry):
+        item_id = self.aliases.get(self.alias_key(entry))
+        if item_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return item_id
+
+    # Remembers a successful fuzzy match in memory; returns the item_aliases row to save
+    # with the message (see TradeMessageUnit.add_aliases), or None if it's already known
+    def learn(self, entry, item_id):
+        key = self.alias_key(entry)
+        if self.aliases.get(key) == item_id:
+            return None
+
+        self.aliases[key] = item_id
+        alias_name, item_grade, item_duration = key
+        return {
+            "alias_name": alias_name, "item_grade": item_grade, "item_duration": item_duration, "item_id": item_id
+        }
+
+    # Drops aliases pointing to the given item ids, or all of them (catalog rebuilt)
+    def invalidate(self, item_ids=None):
+        if item_ids is None:
+            self.aliases.clear()
+            logger.info("All item aliases invalidated")
+            return
+
+        item_ids = set(item_ids)
+        stale = [key for key, item_id in self.aliases.items() if item_id in item_ids]
+        for key in stale:
+            del self.aliases[key]
+        logger.info(f"Invalidated {len(stale)} item aliases")
+
+    # Drops aliases a new or changed item could now be the better match for:
+    # those with a compatible grade and duration, in memory and in DB
+    async def invalidate_for_items(self, items):
+        keys = set()
+        for item in items:
+            for grade in (item.item_grade, "undefined"):
+                for duration in (item.item_duration, "undefined"):
+                    keys.add((grade, duration))
+
+        stale = [key for key in self.aliases if (key[1], key[2]) in keys]
+        for key in stale:
+            del self.aliases[key]
+        await delete_item_aliases_for(keys)
+        logger.info(f"Invalidated {len(stale)} item aliases for {len(items)} changed items")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "aliases": len(self.aliases),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+
+alias_resolver = AliasResolver()
@@ -1,8 +1,14 @@
+import copy
 import logging
-from rapidfuzz import fuzz
+import numpy as np
+from rapidfuzz import fuzz, process
 
 logger = logging.getLogger(__name__)
 
+# Weights of the two fuzzy scorers in the final match score
+RATIO_WEIGHT = 0.4
+PARTIAL_RATIO_WEIGHT = 0.6
+
 
 def filter_by_grade_and_duration(top5, entry, items_in_db):
 
@@ -10,22 +16,22 @@ def filter_by_grade_and_duration(top5, entry, items_in_db):
     if entry['item_grade'] != 'undefined':
         top5 = [x for x in top5 if x and items_in_db[x["index"]].item_grade == entry['item_grade']]
     elif len(top5) >= 2 and top5[0]["item_name"] == top5[1]["item_name"]:
-        logger.warning(f"No unique match found for item: {entry['item_name']}")
+        logger.warning(f"No unique match found for item: {entry['item_name']}", extra={"repetitive": True})
         return None
 
     if not top5:
-        logger.warning(f"No match found for: {entry['item_name']}")
+        logger.warning(f"No match found for: {entry['item_name']}", extra={"repetitive": True})
         return None
 
     # Filter by duration
     if entry['item_duration'] != 'undefined':
         top5 = [x for x in top5 if x and items_in_db[x["index"]].item_duration == entry['item_duration']]
     elif len(top5) >= 2 and top5[0]["item_name"] == top5[1]["item_name"]:
-        logger.warning(f"No unique duration match for item: {entry['item_name']}")
+        logger.warning(f"No unique duration match for item: {entry['item_name']}", extra={"repetitive": True})
         return None
 
     if not top5:
-        logger.warning(f"No valid match found for: {entry['item_name']}")
+        logger.warning(f"No valid match found for: {entry['item_name']}", extra={"repetitive": True})
         return None
 
     best_match = top5[0]
@@ -36,6 +42,7 @@ def filter_by_grade_and_duration(top5, entry, items_in_db):
         return top5[0]
 
 
+# Reference implementation, kept for benchmarks (see benchmarks/items_matcher_benchmark.py)
 def find_top5_item_matches(items_in_db, entry):
     entry_name = entry['item_name'].lower()
     candidates = []
@@ -46,7 +53,7 @@ def find_top5_item_matches(items_in_db, entry):
         # Считаем score
         ratio_score = fuzz.ratio(entry_name, db_name)
         partial_score = fuzz.partial_ratio(entry_name, db_name)
-        current_score = (ratio_score * 0.4 + partial_score * 0.6)
+        current_score = (ratio_score * RATIO_WEIGHT + partial_score * PARTIAL_RATIO_WEIGHT)
 
         candidates.append({
             "item_name": db_item.item_name,
@@ -56,4 +63,95 @@ def find_top5_item_matches(items_in_db, entry):
 
     candidates.sort(key=lambda x: x["score"], reverse=True)
 
-    return candidates[:5]
\ No newline at end of file
+    return candidates[:5]
+
+
+# Returns indices of the k best scores, ordered by score desc and then by index
+# (same order as a stable full sort), using a partial selection instead of a sort.
+def top_k_indices(scores, k):
+    n = len(scores)
+    if n <= k:
+        indices = np.arange(n)
+    else:
+        kth_score = np.partition(scores, n - k)[n - k]
+        indices = np.flatnonzero(scores > kth_score)
+        ties = np.flatnonzero(scores == kth_score)[:k - len(indices)]
+        indices = np.concatenate((indices, ties))
+
+    order = np.lexsort((indices, -scores[indices]))
+    return indices[order]
+
+
+# Item matcher built once from the catalog: keeps lowercased names in one list
+# and scores all entries of a message against it in a single batched call.
+class ItemsMatcher:
+
+    def __init__(self, items_in_db, top_k=5, workers=1):
+        self.items = list(items_in_db)
+        self.names = [item.item_name.lower() for item in self.items]
+        self.index_by_id = {item.id: j for j, item in enumerate(self.items)}
+        self.top_k = top_k
+        self.workers = workers
+        logger.info(f"Items matcher built for {len(self.items)} items")
+
+    def __len__(self):
+        return len(self.items)
+
+    # New matcher with added or changed items (this one is left untouched, so workers can
+    # keep using it until the new one is swapped in). Indices of existing items don't move.
+    def with_items(self, changed_items):
+        matcher = copy.copy(self)
+        matcher.items = list(self.items)
+        matcher.names = list(self.names)
+        matcher.index_by_id = dict(self.index_by_id)
+
+        for item in changed_items:
+            j = matcher.index_by_id.get(item.id)
+            if j is None:
+                matcher.index_by_id[item.id] = len(matcher.items)
+                matcher.items.append(item)
+                matcher.names.append(item.item_name.lower())
+            else:
+                matcher.items[j] = item
+                matcher.names[j] = item.item_name.lower()
+
+        logger.info(f"Items matcher updated with {len(changed_items)} items: {len(matcher.items)} items")
+        return matcher
+
+    # Weighted ratio/partial_ratio scores, one row per query name
+    def score(self, queries):
+        ratio_scores = process.cdist(
+            queries, self.names, scorer=fuzz.ratio, dtype=np.float64, workers=self.workers
+        )
+        partial_scores = process.cdist(
+            queries, self.names, scorer=fuzz.partial_ratio, dtype=np.float64, workers=self.workers
+        )
+        return ratio_scores * RATIO_WEIGHT + partial_scores * PARTIAL_RATIO_WEIGHT
+
+    # Top-k candidates over the whole catalog, in the same format as find_top5_item_matches
+    def find_top_matches(self, entries):
+        if not entries:
+            return []
+        if not self.items:
+            return [[] for _ in entries]
+
+        scores = self.score([entry['item_name'].lower() for entry in entries])
+        return [self.candidates(row) for row in scores]
+
+    # Best catalog match for every entry (or None), with the grade/duration
+    # ambiguity rules of filter_by_grade_and_duration
+    def find_best_matches(self, entries):
+        return [
+            filter_by_grade_and_duration(top5, entry, self.items)
+            for entry, top5 in zip(entries, self.find_top_matches(entries))
+        ]
+
+    def candidates(self, row):
+        return [
+            {
+                "item_name": self.items[j].item_name,
+                "index": int(j),
+                "score": float(row[j])
+            }
+            for j in top_k_indices(row, self.top_k)
+        ]
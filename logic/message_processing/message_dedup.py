@@ -0,0 +1,63 @@
+import logging
+from collections import OrderedDict
+
+from config import settings
+from database.queries import get_message_hashes
+
+logger = logging.getLogger(__name__)
+
+
+# Drops reposted messages before the LLM call.
+# 'seen' mirrors message_text_hashed of the messages table (plus messages being processed),
+# 'parsed_cache' keeps the latest parse results by hash, including messages without offers
+# (failed parses are not cached).
+class MessageDeduplicator:
+
+    def __init__(self, cache_size):
+        self.cache_size = cache_size
+        self.seen = set()
+        self.parsed_cache = OrderedDict()
+        self.duplicates = 0
+        self.cache_hits = 0
+
+    # Loads hashes of stored messages (called once at worker start)
+    async def warm(self):
+        self.seen = set(await get_message_hashes())
+        logger.info(f"Duplicate filter warmed with {len(self.seen)} message hashes")
+
+    # Marks message as taken; False if the same text is already stored or being processed
+    def claim(self, message_hash):
+        if message_hash in self.seen:
+            self.duplicates += 1
+            return False
+        self.seen.add(message_hash)
+        return True
+
+    # Called when a claimed message was not stored, so the same text can come again
+    def release(self, message_hash):
+        self.seen.discard(message_hash)
+
+    # Returns (True, parsed offers) for known text, (False, None) otherwise
+    def get_parsed(self, message_hash):
+        if message_hash not in self.parsed_cache:
+            return False, None
+        self.parsed_cache.move_to_end(message_hash)
+        self.cache_hits += 1
+        return True, self.parsed_cache[message_hash]
+
+    def remember_parsed(self, message_hash, parsed):
+        self.parsed_cache[message_hash] = parsed
+        self.parsed_cache.move_to_end(message_hash)
+        while len(self.parsed_cache) > self.cache_size:
+            self.parsed_cache.popitem(last=False)
+
+    def stats(self):
+        return {
+            "seen": len(self.seen),
+            "cached": len(self.parsed_cache),
+            "duplicates": self.duplicates,
+            "cache_hits": self.cache_hits
+        }
+
+
+message_deduplicator = MessageDeduplicator(settings.parsed_cache_size)
@@ -1,58 +1,246 @@
+import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 
+from sqlalchemy.exc import IntegrityError
+
+from config import settings
 from database.models import OfferType, CurrencyType
-from database.queries import insert_offer_data_and_return_id, get_items, insert_message_data_and_return_id
-from logic.message_processing.arbitrage import arbitrage_finder
-from logic.message_processing.items_matcher import find_top5_item_matches, filter_by_grade_and_duration
+from database.queries import hash_message, trade_message_transaction
+from logic.message_processing.arbitrage import arbitrage_finder, notify_arbitrages
+from logic.message_processing.catalog import catalog, catalog_reload_worker
+from logic.message_processing.items_aliases import alias_resolver
+from logic.message_processing.items_matcher import filter_by_grade_and_duration
+from logic.message_processing.message_dedup import message_deduplicator
+from logic.message_processing.order_book import order_book
+from logic.message_processing.retention import retention_worker
+from metrics import (
+    stage_seconds, messages_skipped, offers_matched, arbitrages_found, queue_depth, metrics_server
+)
+from tracing import activate, span, record_span, span_exporter
 from parser.group_message_parser import create_request
 
 logger = logging.getLogger(__name__)
 
 
-# Message processing: parse, validate, and save to DB
+# Per-item ordering: every message takes a ticket when a worker dequeues it, and once
+# matching has found its items it registers them in ticket order. A message is written
+# and checked for arbitrage after the earlier messages with any of its items are done,
+# so offers for the same item are stored in arrival order and concurrent workers never
+# miss each other's offers. Messages without offers release their ticket.
+class ItemSequencer:
+
+    def __init__(self):
+        self.issued = 0
+        self.registered = 0
+        self.pending = {}  # ticket -> (item ids, future resolved on registration)
+        self.tails = {}    # item id -> done future of the last registered message with it
+
+    def ticket(self):
+        ticket = self.issued
+        self.issued += 1
+        return ticket
+
+    # Registrations run in ticket order; each resolves with the done futures of the
+    # earlier messages to wait for and the message's own done future
+    def register(self, ticket, item_ids):
+        loop = asyncio.get_running_loop()
+        registration = loop.create_future()
+        self.pending[ticket] = (set(item_ids), registration)
+        while self.registered in self.pending:
+            items, future = self.pending.pop(self.registered)
+            done = loop.create_future()
+            waits = {self.tails[item_id] for item_id in items if item_id in self.tails}
+            for item_id in items:
+                self.tails[item_id] = done
+            future.set_result((waits, done))
+            self.registered += 1
+        return registration
+
+    def finish(self, done):
+        done.set_result(None)
+        for item_id in [item_id for item_id, tail in self.tails.items() if tail is done]:
+            del self.tails[item_id]
+
+    @asynccontextmanager
+    async def hold(self, ticket, item_ids):
+        registration = self.register(ticket, item_ids)
+        try:
+            waits, done = await asyncio.shield(registration)
+        except asyncio.CancelledError:
+            registration.add_done_callback(lambda future: self.finish(future.result()[1]))
+            raise
+
+        try:
+            if waits:
+                await asyncio.wait(waits)
+            yield
+        finally:
+            self.finish(done)
+
+    # Gives up the ticket's turn if the message never reached hold() (duplicate,
+    # no offers, failure), so later messages don't wait for it
+    def release(self, ticket):
+        if ticket >= self.registered and ticket not in self.pending:
+            self.register(ticket, ()).add_done_callback(lambda future: self.finish(future.result()[1]))
+
+
+# Queue depth and time messages spend waiting for a worker
+class QueueStats:
+
+    def __init__(self):
+        self.queue = None
+        self.processed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds):
+        self.processed += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    @property
+    def depth(self):
+        return self.queue.qsize() if self.queue else 0
+
+    # Returns stats for the interval since the last call and starts a new one
+    def snapshot_and_reset(self):
+        snapshot = {
+            "depth": self.depth,
+            "processed": self.processed,
+            "wait_avg": self.wait_total / self.processed if self.processed else 0.0,
+            "wait_max": self.wait_max
+        }
+        self.processed = 0
+        self.wait_total = self.wait_max = 0.0
+        return snapshot
+
+
+item_sequencer = ItemSequencer()
+queue_stats = QueueStats()
+
+
+# Message processing: starts a pool of workers consuming the trade message queue
 async def message_handler(offer_message_queue):
-    items_in_db = await get_items()
-    logger.info(f"Loaded {len(items_in_db)} items from database")
+    await catalog.load()
+    await alias_resolver.load()
+    await message_deduplicator.warm()
+    await order_book.load()
+
+    queue_stats.queue = offer_message_queue
+    queue_depth.set_function(offer_message_queue.qsize)
+    workers = [
+        asyncio.create_task(message_worker(offer_message_queue, worker_id))
+        for worker_id in range(settings.worker_concurrency)
+    ]
+    logger.info(f"Started {len(workers)} message workers (queue size {offer_message_queue.maxsize})")
+
+    await asyncio.gather(
+        queue_monitor(), retention_worker(), catalog_reload_worker(), metrics_server(), span_exporter.run(),
+        *workers
+    )
+
+
+# Logs queue depth and wait time
+async def queue_monitor():
+    while True:
+        await asyncio.sleep(settings.queue_stats_interval)
+        stats = queue_stats.snapshot_and_reset()
+        logger.info(
+            f"Queue depth={stats['depth']}, processed={stats['processed']}, "
+            f"wait avg={stats['wait_avg']:.2f}s max={stats['wait_max']:.2f}s"
+        )
 
+
+# Single consumer: parse, validate, and save to DB
+async def message_worker(offer_message_queue, worker_id):
     while True:
-        message = await offer_message_queue.get()
-        logger.info(f"New message received: {message.raw_text}...")
+        message, queued_at, trace = await offer_message_queue.get()
+        ticket = item_sequencer.ticket()
+        queue_stats.record_wait(time.monotonic() - queued_at)
+        if trace is not None:
+            record_span(trace, "queue", trace.start, time.time_ns())
+
+        error = None
+        try:
+            # Current catalog; a reload swaps it for later messages only
+            with activate(trace):
+                await handle_message(catalog.matcher, message, ticket)
+        except Exception as e:
+            error = e
+            logger.exception(f"Worker {worker_id} failed to process message: {e}")
+        finally:
+            item_sequencer.release(ticket)
+            if trace is not None:
+                trace.finish(error)
+            offer_message_queue.task_done()
+
+
+async def handle_message(matcher, message, ticket):
+    logger.debug(f"New message received: {message.raw_text}...")
+
+    message_hash = hash_message(message.raw_text)
+    if not message_deduplicator.claim(message_hash):
+        logger.debug("Message ignored — duplicate of a stored message")
+        messages_skipped.inc(reason="duplicate")
+        refresh_repost(message_hash, message.date)
+        return
+
+    stored = False
+    try:
+        stored = await parse_and_store_message(matcher, message, message_hash, ticket)
+    finally:
+        if not stored:
+            message_deduplicator.release(message_hash)
+
+
+# A repost keeps the offers of the stored message fresh: in the order book at once,
+# in messages.last_seen_at with the next retention run (no DB call per duplicate)
+def refresh_repost(message_hash, seen_at):
+    message_id = order_book.refresh_message(message_hash, seen_at)
+    if message_id is not None:
+        logger.debug(f"Repost refreshed message id={message_id}")
 
+
+# Returns True if the message was stored in DB
+async def parse_and_store_message(matcher, message, message_hash, ticket):
+    found, response = message_deduplicator.get_parsed(message_hash)
+    if found:
+        logger.debug("Reusing parsed result of identical message")
+    else:
         response = await create_request(message.raw_text)
-        if not response:
-            logger.debug("Message ignored — no valid parsed data")
-            continue
+        # Failed parses (None) are not cached, so a repost gets parsed again
+        if response is not None:
+            message_deduplicator.remember_parsed(message_hash, response)
 
-        message_id = await insert_message_data_and_return_id(message)
-        if not message_id:
-            logger.warning("Message insertion failed — skipping")
-            continue
+    if not response:
+        logger.debug("Message ignored — no valid parsed data")
+        messages_skipped.inc(reason="no_offers")
+        return False
 
-        await process_offer(items_in_db, response, message_id)
+    return await process_offer(matcher, message, message_hash, response, ticket)
 
 
-# Finds match between offer items and db item, then inserts offer in db and calls the arbitrage finder function
-async def process_offer(items_in_db, response, message_id):
+# Finds match between offer items and db items, then saves the message with its offers and
+# arbitrage records in one transaction and sends notifications. Returns True if saved.
+async def process_offer(matcher, message, message_hash, response, ticket):
+    entries = []
     for entry in response:
         if not isinstance(entry["price_for_one"], int):
             logger.debug(f"Skipping — invalid price: {entry['price_for_one']}")
             continue
+        entries.append(entry)
 
-        # Top 5 matches
-        top5 = find_top5_item_matches(items_in_db, entry)
-
-        logger.debug(f"Top 5 matches for '{entry['item_name']}': {top5}")
-
-        # Filter
-        best_match = filter_by_grade_and_duration(top5, entry, items_in_db)
-
-        if not best_match: continue
-
-        db_item = items_in_db[best_match["index"]]
-        logger.info(f"Matched '{entry['item_name']}' → '{db_item.item_name}' ({best_match['score']:.1f}%)")
+    with span("match", entries=len(entries)):
+        matched_items, new_aliases = await match_entries(matcher, entries)
+    matched = sum(1 for db_item in matched_items if db_item)
+    offers_matched.inc(matched, result="matched")
+    offers_matched.inc(len(entries) - matched, result="unmatched")
 
-        # Prepare and insert offer data
-        offer_data = {
+    # Prepare offer data
+    offers_data = [
+        {
             "id": None,
             "item_name_message": entry['item_name'],
             "item_name_db": db_item.item_name,
@@ -62,15 +250,108 @@ async def process_offer(items_in_db, response, message_id):
             "offer_type": OfferType(entry['offer_type']),
             "currency": CurrencyType(entry['currency']),
             "price_for_one": entry['price_for_one'],
-            "message_id": message_id
+            "message_id": None,
+            "message_hash": message_hash,
+            "seen_at": message.date
         }
+        for entry, db_item in zip(entries, matched_items) if db_item
+    ]
 
-        offer_data['id'] = await insert_offer_data_and_return_id(offer_data)
-        if not offer_data['id']:
-            logger.error(f"Offer insert failed for {offer_data['item_name']}")
-            continue
+    sender = await message.get_sender()
+
+    async with item_sequencer.hold(ticket, [offer_data['item_id'] for offer_data in offers_data]):
+        try:
+            with span("store", offers=len(offers_data)):
+                arbitrage_ids = await save_message_offers_and_arbitrage(message, sender, offers_data, new_aliases)
+        except IntegrityError as e:
+            logger.warning(f"Message insertion failed — skipping: {e.orig}")
+            messages_skipped.inc(reason="store_failed")
+            return False
+
+    arbitrages_found.inc(len(arbitrage_ids))
+    notify_arbitrages(arbitrage_ids)
+    return True
+
+
+# Writes message, offers, arbitrage records and newly learned aliases in one transaction;
+# returns arbitrage ids.
+# Offers are added to the order book as they are written (so later offers of the same
+# message see earlier ones) and removed again if the transaction fails.
+async def save_message_offers_and_arbitrage(message, sender, offers_data, new_aliases=()):
+    added_to_book = []
+    try:
+        async with trade_message_transaction() as unit:
+            message_id = await unit.add_message(message, sender)
+            for offer_data in offers_data:
+                offer_data['message_id'] = message_id
 
-        logger.info(f"Offer inserted successfully for '{offer_data['item_name']}'")
-        await arbitrage_finder(offer_data)
+            offer_ids = await unit.add_offers(offers_data)
 
+            arbitrage_pairs = []
+            for offer_data, offer_id in zip(offers_data, offer_ids):
+                offer_data['id'] = offer_id
+                with stage_seconds.time(stage="arbitrage_finder"), \
+                        span("arbitrage_finder", item_id=offer_data['item_id']):
+                    arbitrage_pairs.extend(arbitrage_finder(offer_data))
+                order_book.add(offer_data)
+                added_to_book.append(offer_id)
+
+            arbitrage_ids = await unit.add_arbitrages(arbitrage_pairs)
+            await unit.add_aliases(list(new_aliases))
+
+    except Exception:
+        for offer_id in added_to_book:
+            order_book.remove(offer_id)
+        raise
+
+    for arbitrage_id, (buy_offer, sell_offer) in zip(arbitrage_ids, arbitrage_pairs):
+        order_book.add_arbitrage(arbitrage_id, buy_offer['id'], sell_offer['id'])
+
+    logger.info(
+        f"Saved message id={message_id} with {len(offer_ids)} offers "
+        f"and {len(arbitrage_ids)} arbitrage records"
+    )
+    return arbitrage_ids
+
+
+# Resolves catalog item for every entry (None if no reliable match):
+# learned aliases first, then fuzzy matching for the rest.
+# Returns the items and the alias rows learned from fuzzy matches (saved with the message).
+async def match_entries(matcher, entries):
+    # Known aliases resolve directly, the rest goes to the fuzzy matcher
+    matched_items = [None] * len(entries)
+    new_aliases = []
+    unresolved = []
+    for position, entry in enumerate(entries):
+        item_id = alias_resolver.resolve(entry)
+        index = matcher.index_by_id.get(item_id)
+        if index is None:
+            if item_id is not None:
+                # Alias points to an item that is no longer in the catalog
+                alias_resolver.invalidate([item_id])
+            unresolved.append(position)
+        else:
+            matched_items[position] = matcher.items[index]
+            logger.info(f"Alias hit '{entry['item_name']}' → '{matcher.items[index].item_name}'")
+
+    # Top 5 matches for all unresolved entries at once
+    with stage_seconds.time(stage="match"):
+        all_top5 = matcher.find_top_matches([entries[position] for position in unresolved])
+
+    for position, top5 in zip(unresolved, all_top5):
+        entry = entries[position]
+        logger.debug(f"Top 5 matches for '{entry['item_name']}': {top5}")
+
+        # Filter
+        best_match = filter_by_grade_and_duration(top5, entry, matcher.items)
+
+        if not best_match: continue
+
+        db_item = matcher.items[best_match["index"]]
+        logger.info(f"Matched '{entry['item_name']}' → '{db_item.item_name}' ({best_match['score']:.1f}%)")
+        matched_items[position] = db_item
+        alias = alias_resolver.learn(entry, db_item.id)
+        if alias is not None:
+            new_aliases.append(alias)
 
+    return matched_items, new_aliases
@@ -0,0 +1,290 @@
+import heapq
+import logging
+import math
+from bisect import bisect_left, bisect_right, insort
+from datetime import timezone
+
+from database.models import OfferType
+from database.queries import get_open_offers, get_arbitrage_offer_pairs, freshness_cutoff, arbitrage_values
+
+logger = logging.getLogger(__name__)
+
+
+# SQLite gives back naive datetimes (stored in UTC); the book compares seen_at with
+# aware cutoffs and Telegram dates, so every value entering it is made UTC-aware
+def as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+# Offer data in the format used by arbitrage_finder
+def offer_to_dict(offer, message_hash, seen_at):
+    return {
+        "id": offer.id,
+        "item_id": offer.item_id,
+        "item_name": offer.item_name_db,
+        "currency": offer.currency,
+        "price_for_one": offer.price_for_one,
+        "quantity": offer.quantity,
+        "offer_type": offer.offer_type,
+        "message_id": offer.message_id,
+        "message_hash": message_hash,
+        "seen_at": as_utc(seen_at)
+    }
+
+
+# In-memory copy of open buy/sell offers, keyed on (item_id, currency).
+# Each side is a list of (price, offer_id) sorted by price, so offers crossing
+# a new one are found with a binary search instead of a DB query.
+# Offers leave the book when their message was last seen (sent or reposted) before the
+# freshness window: crossing_offers skips them at once, expire() drops them from memory.
+# Reposts move seen_at forward in memory at once; the dates are written to
+# messages.last_seen_at in batches (see unsaved_reposts).
+# The book also keeps open arbitrages (both offers still in the book) with their
+# current values, which the bot's market commands read without touching the DB.
+class OrderBook:
+
+    def __init__(self):
+        self.books = {}
+        self.offers = {}
+        self.message_offers = {}
+        self.expiry_heap = []
+        self.arbitrages = {}
+        self.offer_arbitrages = {}
+        self.item_labels = {}
+        self.message_ids = {}
+        self.unsaved_reposts = {}
+
+    # Loads all fresh open offers and their arbitrages from DB (called once at worker start)
+    async def load(self):
+        self.books.clear()
+        self.offers.clear()
+        self.message_offers.clear()
+        self.expiry_heap.clear()
+        self.arbitrages.clear()
+        self.offer_arbitrages.clear()
+        self.message_ids.clear()
+        for offer, message_hash, seen_at in await get_open_offers():
+            self.add(offer_to_dict(offer, message_hash, seen_at))
+        for arbitrage_id, buy_offer_id, sell_offer_id in await get_arbitrage_offer_pairs():
+            self.add_arbitrage(arbitrage_id, buy_offer_id, sell_offer_id)
+        logger.info(
+            f"Order book loaded with {len(self.offers)} offers in {len(self.books)} books "
+            f"and {len(self.arbitrages)} open arbitrages"
+        )
+
+    # Item names with grade and duration, shown by the bot's market commands
+    def set_catalog(self, items_in_db):
+        self.item_labels = {
+            item.id: f"{item.item_name} {item.item_grade} {item.item_duration}" for item in items_in_db
+        }
+
+    @staticmethod
+    def side_name(offer_type):
+        return "buy" if offer_type == OfferType.BUY else "sell"
+
+    def side(self, item_id, currency, offer_type):
+        book = self.books.setdefault((item_id, currency), {"buy": [], "sell": []})
+        return book[self.side_name(offer_type)]
+
+    # Adds inserted offer (TRADE offers never take part in arbitrage and are skipped)
+    def add(self, offer_data_dict):
+        if offer_data_dict['offer_type'] not in (OfferType.BUY, OfferType.SELL):
+            return
+
+        offer = {
+            key: offer_data_dict[key]
+            for key in (
+                "id", "item_id", "item_name", "currency", "price_for_one", "quantity", "offer_type",
+                "message_id", "message_hash", "seen_at"
+            )
+        }
+        self.offers[offer['id']] = offer
+        self.message_offers.setdefault(offer['message_id'], set()).add(offer['id'])
+        self.message_ids[offer['message_hash']] = offer['message_id']
+        heapq.heappush(self.expiry_heap, (offer['seen_at'], offer['id']))
+        side = self.side(offer['item_id'], offer['currency'], offer['offer_type'])
+        insort(side, (offer['price_for_one'], offer['id']))
+
+    # Returns what restore() needs to put the offer back, or None if it wasn't in the book
+    def remove(self, offer_id):
+        offer = self.offers.pop(offer_id, None)
+        if offer is None:
+            return None
+
+        message_offers = self.message_offers.get(offer['message_id'])
+        if message_offers is not None:
+            message_offers.discard(offer_id)
+            if not message_offers:
+                del self.message_offers[offer['message_id']]
+                self.message_ids.pop(offer['message_hash'], None)
+
+        arbitrages = []
+        for arbitrage_id in self.offer_arbitrages.pop(offer_id, ()):
+            arbitrage = self.arbitrages.get(arbitrage_id)
+            if arbitrage is not None:
+                arbitrages.append((arbitrage_id, arbitrage['buy_offer'], arbitrage['sell_offer']))
+            self.remove_arbitrage(arbitrage_id)
+
+        side = self.side(offer['item_id'], offer['currency'], offer['offer_type'])
+        entry = (offer['price_for_one'], offer_id)
+        position = bisect_left(side, entry)
+        if position < len(side) and side[position] == entry:
+            del side[position]
+        logger.debug(f"Offer id={offer_id} removed from order book")
+        return offer, arbitrages
+
+    # Puts back an offer taken out by remove(), with its arbitrages whose other offer is still in the book
+    def restore(self, removed):
+        offer, arbitrages = removed
+        self.add(offer)
+        for arbitrage_id, buy_offer_id, sell_offer_id in arbitrages:
+            self.add_arbitrage(arbitrage_id, buy_offer_id, sell_offer_id)
+        logger.debug(f"Offer id={offer['id']} restored to order book")
+
+    def update_quantity(self, offer_id, new_quantity):
+        offer = self.offers.get(offer_id)
+        if offer is not None:
+            offer['quantity'] = new_quantity
+            for arbitrage_id in self.offer_arbitrages.get(offer_id, ()):
+                arbitrage = self.arbitrages[arbitrage_id]
+                arbitrage.update(self.arbitrage_values(arbitrage['buy_offer'], arbitrage['sell_offer']))
+
+    def arbitrage_values(self, buy_offer_id, sell_offer_id):
+        return arbitrage_values(self.offers[buy_offer_id], self.offers[sell_offer_id])
+
+    # Tracks saved arbitrage record while both of its offers are in the book
+    def add_arbitrage(self, arbitrage_id, buy_offer_id, sell_offer_id):
+        if buy_offer_id not in self.offers or sell_offer_id not in self.offers:
+            return
+
+        self.arbitrages[arbitrage_id] = {"id": arbitrage_id, **self.arbitrage_values(buy_offer_id, sell_offer_id)}
+        self.offer_arbitrages.setdefault(buy_offer_id, set()).add(arbitrage_id)
+        self.offer_arbitrages.setdefault(sell_offer_id, set()).add(arbitrage_id)
+
+    def remove_arbitrage(self, arbitrage_id):
+        arbitrage = self.arbitrages.pop(arbitrage_id, None)
+        if arbitrage is None:
+            return
+
+        for offer_id in (arbitrage['buy_offer'], arbitrage['sell_offer']):
+            offer_arbitrages = self.offer_arbitrages.get(offer_id)
+            if offer_arbitrages is not None:
+                offer_arbitrages.discard(arbitrage_id)
+                if not offer_arbitrages:
+                    del self.offer_arbitrages[offer_id]
+
+    # A repost of a message with offers in the book keeps them fresh from the repost's date.
+    # Returns the message id, or None if none of the message's offers is in the book.
+    def refresh_message(self, message_hash, seen_at):
+        message_id = self.message_ids.get(message_hash)
+        if message_id is None:
+            return None
+
+        for offer_id in self.message_offers.get(message_id, ()):
+            offer = self.offers[offer_id]
+            if seen_at > offer['seen_at']:
+                offer['seen_at'] = seen_at
+                heapq.heappush(self.expiry_heap, (seen_at, offer_id))
+        unsaved = self.unsaved_reposts.get(message_id)
+        if unsaved is None or seen_at > unsaved:
+            self.unsaved_reposts[message_id] = seen_at
+        return message_id
+
+    # Forgets repost dates written to the database (unless a newer repost came meanwhile)
+    def reposts_saved(self, saved):
+        for message_id, seen_at in saved.items():
+            if self.unsaved_reposts.get(message_id) == seen_at:
+                del self.unsaved_reposts[message_id]
+
+    # Drops offers last seen before cutoff; returns how many were dropped.
+    # Heap entries left behind by refresh_message or remove are skipped.
+    def expire(self, cutoff):
+        expired = 0
+        while self.expiry_heap and self.expiry_heap[0][0] < cutoff:
+            seen_at, offer_id = heapq.heappop(self.expiry_heap)
+            offer = self.offers.get(offer_id)
+            if offer is not None and offer['seen_at'] == seen_at:
+                self.remove(offer_id)
+                expired += 1
+        return expired
+
+    # Fresh opposite-type offers that make arbitrage with the given one:
+    # BUY offers priced above a SELL, or SELL offers priced below a BUY
+    def crossing_offers(self, offer_data_dict):
+        book = self.books.get((offer_data_dict['item_id'], offer_data_dict['currency']))
+        if not book:
+            return []
+
+        price = offer_data_dict['price_for_one']
+        if offer_data_dict['offer_type'] == OfferType.SELL:
+            side = book["buy"]
+            entries = side[bisect_right(side, (price, math.inf)):]
+        else:
+            side = book["sell"]
+            entries = side[:bisect_left(side, (price, -math.inf))]
+
+        cutoff = freshness_cutoff()
+        return [
+            self.offers[offer_id] for _, offer_id in entries
+            if self.offers[offer_id]['seen_at'] >= cutoff
+        ]
+
+    # Fresh offers of one book side, best price first (highest buy, lowest sell)
+    def best_offers(self, item_id, currency, offer_type, limit=5):
+        book = self.books.get((item_id, currency))
+        if not book:
+            return []
+
+        side = book[self.side_name(offer_type)]
+        ordered = reversed(side) if offer_type == OfferType.BUY else side
+        cutoff = freshness_cutoff()
+        best = []
+        for _, offer_id in ordered:
+            offer = self.offers[offer_id]
+            if offer['seen_at'] >= cutoff:
+                best.append(offer)
+                if len(best) == limit:
+                    break
+        return best
+
+    # Items with open offers whose label contains the query (case-insensitive)
+    def find_items(self, query):
+        query = query.casefold()
+        item_ids = {item_id for item_id, _ in self.books}
+        return sorted(
+            (item_id, self.label(item_id)) for item_id in item_ids
+            if query in self.label(item_id).casefold()
+        )
+
+    def label(self, item_id):
+        return self.item_labels.get(item_id, f"item id={item_id}")
+
+    # Open arbitrages with the largest total profit (records without quantity go last)
+    def top_arbitrages(self, limit=5):
+        return heapq.nlargest(
+            limit, self.arbitrages.values(),
+            key=lambda arbitrage: (arbitrage['profit_for_all'] is not None, arbitrage['profit_for_all'] or 0,
+                                   arbitrage['profit_for_one'])
+        )
+
+    # Best buy minus best sell for every book with both sides; positive spread means arbitrage
+    def spreads(self, limit=10):
+        spreads = []
+        for (item_id, currency) in self.books:
+            best_buy = self.best_offers(item_id, currency, OfferType.BUY, limit=1)
+            best_sell = self.best_offers(item_id, currency, OfferType.SELL, limit=1)
+            if best_buy and best_sell:
+                spreads.append({
+                    "item_id": item_id,
+                    "currency": currency,
+                    "best_buy": best_buy[0],
+                    "best_sell": best_sell[0],
+                    "spread": best_buy[0]['price_for_one'] - best_sell[0]['price_for_one']
+                })
+        return heapq.nlargest(limit, spreads, key=lambda spread: spread['spread'])
+
+    def __len__(self):
+        return len(self.offers)
+
+
+order_book = OrderBook()
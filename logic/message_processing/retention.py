@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from config import settings
+from database.db_main import engine
+from database.queries import archive_expired_messages, freshness_cutoff, save_message_reposts
+from logic.message_processing.message_dedup import message_deduplicator
+from logic.message_processing.order_book import order_book
+
+logger = logging.getLogger(__name__)
+
+
+# Background retention: writes repost dates collected by the order book, drops expired offers
+# from the order book and moves expired messages with their offers and arbitrage records
+# to the *_archive tables
+async def retention_worker():
+    archive_enabled = engine.dialect.name == "postgresql"
+    if not archive_enabled:
+        logger.info(f"Archiving of expired messages skipped for {engine.dialect.name} database.")
+
+    while True:
+        await asyncio.sleep(settings.retention_interval)
+        try:
+            await run_retention(archive_enabled)
+        except Exception as e:
+            logger.exception(f"Retention run failed: {e}")
+
+
+async def run_retention(archive_enabled):
+    # Before archiving, so reposted messages whose offers are still in the book stay in the DB
+    reposts = dict(order_book.unsaved_reposts)
+    if reposts:
+        await save_message_reposts(reposts)
+        order_book.reposts_saved(reposts)
+
+    cutoff = freshness_cutoff()
+    expired = order_book.expire(cutoff)
+    if expired:
+        logger.info(f"Expired {expired} offers from order book")
+
+    if not archive_enabled:
+        return
+
+    # Rows leave the DB one interval after they left the order book, so a worker that
+    # matched an offer just before it expired can still write its arbitrage record
+    archive_cutoff = cutoff - timedelta(seconds=settings.retention_interval)
+
+    totals = {"messages": 0, "offers": 0, "arbitrage": 0}
+    while True:
+        message_hashes, counts = await archive_expired_messages(archive_cutoff, settings.retention_batch_size)
+
+        # Archived texts may be posted again and must not be dropped as duplicates
+        for message_hash in message_hashes:
+            message_deduplicator.release(message_hash)
+        for table, count in counts.items():
+            totals[table] += count
+
+        if len(message_hashes) < settings.retention_batch_size:
+            break
+        # Let the workers run between batches
+        await asyncio.sleep(0)
+
+    if totals["messages"]:
+        logger.info(
+            f"Archived {totals['messages']} messages, {totals['offers']} offers "
+            f"and {totals['arbitrage']} arbitrage records"
+        )
@@ -1,6 +1,7 @@
 import asyncio
 import logging
 
+from config import settings
 from database.queries import init_db
 from logic.message_processing.message_processor import message_handler
 from telegram.bot.arbitrage_notification_bot import bot_execution
@@ -17,7 +18,7 @@ async def run_messages_handler():
     # await clear_db_without_items()
     await init_db()
 
-    offer_message_queue = asyncio.Queue()
+    offer_message_queue = asyncio.Queue(maxsize=settings.offer_queue_size)
 
     # Launch concurrent async tasks
     client_run_task = asyncio.create_task(run_client_forever())
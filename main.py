@@ -1,15 +1,14 @@
 import asyncio
 import logging
 from config import settings
+from logging_setup import setup_logging
 from logic.items_init import items_in_file_renew
+from logic.catalog_snapshot import export_catalog, import_catalog
 from logic.messages_handler import run_messages_handler
 
 
-# Logging setup
-logging.basicConfig(
-    level=logging.DEBUG,  # change to DEBUG for detailed logs
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-)
+# Logging setup (LOG_PROFILE)
+setup_logging()
 logger = logging.getLogger("main")
 
 logger.info("Application startup initiated")
@@ -28,6 +27,14 @@ if __name__ == "__main__":
             logger.info("Running in TRADE WORKER mode")
             asyncio.run(run_messages_handler())
 
+        elif settings.app_mode == "catalog_export":
+            logger.info("Running in CATALOG EXPORT mode")
+            asyncio.run(export_catalog())
+
+        elif settings.app_mode == "catalog_import":
+            logger.info("Running in CATALOG IMPORT mode")
+            asyncio.run(import_catalog())
+
         else:
             raise ValueError(f"Unknown APP_MODE: {settings.app_mode}")
 
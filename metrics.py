@@ -0,0 +1,188 @@
+import asyncio
+import functools
+import logging
+import time
+from contextlib import contextmanager
+
+from config import settings
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of histogram buckets: sub-millisecond in-memory stages up to LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LOOP_LAG_INTERVAL = 0.5
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+# In-memory metrics rendered in the Prometheus text format. Every metric keeps one
+# series per label set (label values are passed as keyword arguments).
+class Metric:
+    kind = None
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.series = {}
+        registry.append(self)
+
+    @staticmethod
+    def key(labels):
+        return tuple(sorted(labels.items()))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{format_labels(labels)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, description):
+        super().__init__(name, description)
+        self.function = None
+
+    def set(self, value, **labels):
+        self.series[self.key(labels)] = value
+
+    # Value read at scrape time (e.g. a queue size)
+    def set_function(self, function):
+        self.function = function
+
+    def render(self):
+        if self.function is not None:
+            self.set(self.function())
+        return super().render()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["counts"][position] += 1
+                break
+        series["sum"] += value
+        series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                bucket_labels = labels + (("le", format_value(bound)),)
+                lines.append(f"{self.name}_bucket{format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {series['count']}")
+        return lines
+
+
+registry = []
+
+stage_seconds = Histogram(
+    "trade_stage_seconds",
+    "Duration of pipeline stages (prefilter, llm, match, arbitrage_finder, notify)"
+)
+db_call_seconds = Histogram("trade_db_call_seconds", "Duration of database calls by query function")
+messages_skipped = Counter("trade_messages_skipped_total", "Trade messages not stored, by reason")
+offers_matched = Counter("trade_offers_total", "Parsed offers by catalog match result (matched, unmatched)")
+arbitrages_found = Counter("trade_arbitrages_found_total", "Arbitrage records created")
+queue_depth = Gauge("trade_queue_depth", "Trade messages waiting in the worker queue")
+loop_lag = Gauge("event_loop_lag_seconds", "Delay of a timer callback on the worker's event loop")
+
+
+# Times every call of an async DB function under its name (and traces it as a span)
+def timed_db_call(function):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        with db_call_seconds.time(call=function.__name__), span(f"db.{function.__name__}"):
+            return await function(*args, **kwargs)
+    return wrapper
+
+
+def render_metrics():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def handle_scrape(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, content_type, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", render_metrics()
+        else:
+            status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", "Not found\n"
+
+        payload = body.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+
+# How late a timer fires: time the loop was busy with other callbacks
+async def loop_lag_monitor():
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        loop_lag.set(max(0.0, time.monotonic() - started - LOOP_LAG_INTERVAL))
+
+
+# Serves GET /metrics on METRICS_PORT from the worker's event loop (disabled with port 0)
+async def metrics_server():
+    if not settings.metrics_port:
+        return
+
+    server = await asyncio.start_server(handle_scrape, settings.metrics_host, settings.metrics_port)
+    logger.info(f"Metrics endpoint listening on {settings.metrics_host}:{settings.metrics_port}/metrics")
+    async with server:
+        await loop_lag_monitor()
@@ -1,9 +1,12 @@
+import asyncio
 import logging
 import json
-import re
-from rapidfuzz import process, fuzz
 from openai import AsyncOpenAI
 from config import settings
+from metrics import stage_seconds, messages_skipped
+from tracing import span
+from parser.rule_based_parser import parse_with_rules, rule_parser_stats
+from parser.trade_prefilter import contains_buy_sell
 
 # Logging
 logger = logging.getLogger(__name__)
@@ -15,24 +18,43 @@ client = AsyncOpenAI(
 )
 
 
-# Checks if message contains 'buy' or 'sell' keywords with fuzzy matching.
-def contains_buy_sell(text: str, threshold: int = 85) -> bool:
-    keywords = ["продам", "продажа", "продаю", "куплю", "скупка", "покупаю", "покупка"]
-    words = re.findall(r"\w+", text.lower())
+# Parses trade message into offers: [] if it has none, None if the model's answer
+# couldn't be used (such a result is not cached, a repost is parsed again).
+# Rigid templates are parsed locally (RULE_PARSER_MODE=on), the rest goes to the model,
+# one message per request or in batches when LLM_BATCH_SIZE > 1.
+async def create_request(message: str):
 
-    for kw in keywords:
-        match = process.extractOne(query=kw, choices=words, scorer=fuzz.partial_ratio)
-        if match and match[1] >= threshold:
-            return True
-    return False
+    with stage_seconds.time(stage="prefilter"), span("prefilter"):
+        has_keywords = contains_buy_sell(message)
+    if not has_keywords:
+        logger.debug("No buy/sell keywords found in message — skipping.")
+        messages_skipped.inc(reason="prefilter")
+        return []
 
+    local_offers = None
+    if settings.rule_parser_mode != "off":
+        local_offers = parse_with_rules(message)
 
-# Sends message to llm model and parses response into structured JSON.
-async def create_request(message: str):
+    if local_offers and settings.rule_parser_mode == "on":
+        rule_parser_stats.served_locally += 1
+        logger.info(f"Parsed {len(local_offers)} offers from message without LLM.")
+        return local_offers
 
-    if not contains_buy_sell(message):
-        logger.debug("No buy/sell keywords found in message — skipping.")
-        return None
+    rule_parser_stats.sent_to_llm += 1
+    with stage_seconds.time(stage="llm"), span("llm", batched=llm_batch_size > 1):
+        if llm_batch_size > 1:
+            response = await llm_batcher.submit(message)
+        else:
+            response = await request_single(message)
+
+    if local_offers and settings.rule_parser_mode == "shadow":
+        rule_parser_stats.compare(message, local_offers, response)
+
+    return response
+
+
+# Sends message to llm model and parses response into structured JSON.
+async def request_single(message: str):
 
     logger.info("Sending message to DeepSeek model for parsing...")
 
@@ -47,43 +69,173 @@ async def create_request(message: str):
     )
 
     content = response.choices[0].message.content
-    logger.info(f"Model raw response: {content}...")
+    logger.debug(f"Model raw response: {content}...")
 
     try:
-        data = json.loads(content)
+        return validate_items(json.loads(content))
+    except (json.JSONDecodeError, TypeError) as e:
+        logger.error(f"Failed to parse model response: {e}")
+        return None
 
-        # Normalize model response
-        if isinstance(data, dict) and "items" in data:
-            items = data["items"]
-        elif isinstance(data, dict) and "offers" in data:
-            items = data["offers"]
-        elif isinstance(data, dict):
-            items = [data]
-        elif isinstance(data, list):
-            items = data
-        else:
-            logger.error("Invalid JSON structure from model.")
-            return None
-
-        # Filter valid items
-        items = [
-            obj for obj in items
-            if isinstance(obj.get("price_for_one"), int)
-            and obj.get("currency") in ("cookies", "money")
+
+# Normalizes parsed model response into a list of valid offers: [] if the model found
+# none, None if the response is malformed or none of its offers is valid.
+def validate_items(data):
+
+    # Normalize model response ("None" from the prompt's rules means no offers)
+    if data is None:
+        items = []
+    elif isinstance(data, dict) and "items" in data:
+        items = data["items"]
+    elif isinstance(data, dict) and "offers" in data:
+        items = data["offers"]
+    elif isinstance(data, dict):
+        items = [data] if data else []
+    elif isinstance(data, list):
+        items = data
+    else:
+        logger.error("Invalid JSON structure from model.")
+        return None
+
+    if not items:
+        logger.info("Model found no offers in message.")
+        return []
+
+    # Filter valid items
+    valid_items = [
+        obj for obj in items
+        if isinstance(obj.get("price_for_one"), int)
+        and obj.get("currency") in ("cookies", "money")
+    ]
+
+    if valid_items:
+        logger.info(f"Parsed {len(valid_items)} valid offers from message.")
+        return valid_items
+    else:
+        logger.warning("No valid items found in model response.", extra={"repetitive": True})
+        return None
+
+
+# Sends several messages in one request and returns parsed offers per message.
+# Returns None for the whole batch if the response is malformed.
+async def request_batch(messages: list[str]):
+
+    logger.info(f"Sending batch of {len(messages)} messages to DeepSeek model for parsing...")
+
+    payload = {"messages": [{"id": i, "text": text} for i, text in enumerate(messages)]}
+    response = await client.chat.completions.create(
+        model=settings.llm_model,
+        temperature=1.0,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": prompt5_english + batch_prompt_english},
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
         ]
+    )
 
-        if items:
-            logger.info(f"Parsed {len(items)} valid offers from message.")
-            return items
-        else:
-            logger.warning("No valid items found in model response.")
-            return None
+    content = response.choices[0].message.content
+    logger.debug(f"Model raw batch response: {content}...")
 
-    except (json.JSONDecodeError, TypeError) as e:
-        logger.error(f"Failed to parse model response: {e}")
+    try:
+        data = json.loads(content)
+        results = data["results"]
+        if not isinstance(results, list):
+            raise TypeError("'results' is not a list")
+
+        parsed = {}
+        for result in results:
+            message_id = result["id"]
+            if not isinstance(message_id, int) or not 0 <= message_id < len(messages):
+                raise ValueError(f"unknown message id {message_id!r}")
+            items = result.get("items") or []
+            parsed[message_id] = validate_items(items if isinstance(items, list) else [items])
+
+        return parsed
+
+    except (json.JSONDecodeError, TypeError, KeyError, ValueError, AttributeError) as e:
+        logger.error(f"Failed to parse model batch response: {e}")
         return None
 
 
+# Collects messages for LLM_BATCH_WINDOW seconds or up to LLM_BATCH_SIZE messages
+# and parses them with one model request. Falls back to per-message requests
+# for messages missing from the response, or for the whole batch if it's malformed.
+class LLMBatcher:
+
+    def __init__(self, max_size, window):
+        self.max_size = max_size
+        self.window = window
+        self.pending = []
+        self.flush_task = None
+        self.send_tasks = set()  # the loop keeps only weak references to tasks
+
+    async def submit(self, message: str):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((message, future))
+
+        if len(self.pending) >= self.max_size:
+            if self.flush_task:
+                self.flush_task.cancel()
+                self.flush_task = None
+            send_task = asyncio.create_task(self.send(self.take()))
+            self.send_tasks.add(send_task)
+            send_task.add_done_callback(self.send_tasks.discard)
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+        return await future
+
+    def take(self):
+        batch, self.pending = self.pending, []
+        return batch
+
+    async def flush_later(self):
+        await asyncio.sleep(self.window)
+        self.flush_task = None
+        await self.send(self.take())
+
+    async def send(self, batch):
+        messages = [message for message, _ in batch]
+
+        parsed = {}
+        if len(batch) > 1:
+            try:
+                parsed = await request_batch(messages)
+            except Exception as e:
+                logger.error(f"Batch request failed: {e}")
+                parsed = None
+
+            if parsed is None:
+                parsed = {}
+                logger.warning(f"Falling back to per-message requests for {len(batch)} messages")
+
+        fallback = [i for i in range(len(batch)) if i not in parsed]
+        if fallback:
+            results = await asyncio.gather(
+                *(request_single(messages[i]) for i in fallback), return_exceptions=True
+            )
+            parsed.update(zip(fallback, results))
+
+        for i, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if isinstance(parsed[i], Exception):
+                future.set_exception(parsed[i])
+            else:
+                future.set_result(parsed[i])
+
+
+# Every worker waits for its own message, so a batch never holds more messages than there
+# are workers; a larger LLM_BATCH_SIZE could never fill and would always wait the window
+llm_batch_size = min(settings.llm_batch_size, settings.worker_concurrency)
+if llm_batch_size < settings.llm_batch_size:
+    logger.warning(
+        f"LLM_BATCH_SIZE={settings.llm_batch_size} is above WORKER_CONCURRENCY={settings.worker_concurrency}, "
+        f"batches are limited to {llm_batch_size} messages"
+    )
+llm_batcher = LLMBatcher(llm_batch_size, settings.llm_batch_window)
+
+
 # System Prompt
 prompt5_english = """
 You are a parser for trade messages from a Russian-language RPG game chat.  
@@ -127,4 +279,16 @@ If the message contains both buy and sell offers — return an array of objects,
 """
 
 
+# Addition to the system prompt for batched requests
+batch_prompt_english = """
 
+**Batch mode:**
+
+The user message is a JSON object `{"messages": [{"id": <int>, "text": <message text>}, ...]}` with several independent trade messages.  
+Apply all the rules above to each message separately and return **one JSON object** of the form:  
+`{"results": [{"id": <id of the message>, "items": [<offer objects of this message>]}, ...]}`
+
+* Return exactly one result for every input `id`.  
+* If a message contains no reliable offers — return an empty `items` array for it.  
+* Never mix offers of different messages.
+"""
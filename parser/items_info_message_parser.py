@@ -1,6 +1,5 @@
 import logging
 import re
-from database.queries import insert_item_data
 
 # Logging
 logger = logging.getLogger(__name__)
@@ -16,54 +15,47 @@ duration_in_name_pattern = re.compile(r'\s*(\d+\s*\w+)$')
 duration_potion_pattern = re.compile(r"Действие:\s*?([A-Za-zА-Яа-яЁё0-9 ]+)")
 
 
-
 # Parses incoming Telegram messages and extracts item info to store in DB.
-async def items_info_parser(event, items_type_and_id_queue, async_flag):
+async def items_info_parser(event, collector):
 
     text = event.raw_text
     logger.debug(f"Received message: {event.raw_text[:100]}...")
 
-    if not items_type_and_id_queue:
-        logger.warning("Queue is empty — skipping message.")
+    request = collector.match_reply(event)
+    if request is None:
+        logger.warning("Reply doesn't match any request in flight — skipping message.")
         return
 
     # Telegram anti-spam warning
     if is_rate_limit_message(text):
-        logger.warning("Rate limit triggered — waiting before retry.")
-        async_flag.set()
+        logger.warning("Rate limit triggered — request will be retried at a lower rate.")
+        collector.retry(request, "rate limit")
         return
 
-    data = items_type_and_id_queue.pop()
-
     # Messages that mean item not found or not transferable
     if is_item_not_found(text):
         logger.debug("Item not found or not transferable.")
-        async_flag.set()
+        collector.complete(request, "not_found")
         return
 
-    name, grade, duration = parse_name_grade_duration(data['type'], text)
+    name, grade, duration = parse_name_grade_duration(request['type'], text)
 
     if not name:
         logger.error("Unknown item type or regex mismatch.")
-        async_flag.set()
+        collector.complete(request, "unparsed")
         return
 
     data_dict = {
         "item_name": name,
-        "item_type": data["type"],
+        "item_type": request["type"],
         "item_grade": grade,
-        "in_game_id": data["in_game_id"],
+        "in_game_id": request["in_game_id"],
         "item_duration": duration
     }
 
-    # insert parsed item into DB
-    try:
-        await insert_item_data(data_dict)
-        logger.info(f"Item inserted: {name} ({grade})")
-    except Exception as e:
-        logger.error(f"Failed to insert item {name}: {e}")
-
-    async_flag.set()
+    # buffered, written to DB in batches by the collector
+    collector.store_item(request, data_dict)
+    logger.info(f"Item parsed: {name} ({grade})")
 
 
 
@@ -86,6 +78,9 @@ def is_item_not_found(text):
 
 
 
+# Name, grade and duration from an item page; (None, None, None) if it can't be read.
+# The recipe and potion names are read from the name line only, and the durations from
+# the name line on, instead of searching the whole reply.
 def parse_name_grade_duration(item_type, text):
     name = None
     grade = None
@@ -94,8 +89,10 @@ def parse_name_grade_duration(item_type, text):
     # Name
     if item_type == 'equipment':
         match = equip_name_pattern.search(text)
-        if match:
-            name = match.group(1).strip()
+        if not match:
+            return None, None, None
+
+        name = match.group(1).strip()
 
     elif item_type == 'resource':
         match = resource_name_pattern.search(text)
@@ -103,15 +100,23 @@ def parse_name_grade_duration(item_type, text):
             return None, None, None
 
         base_name = match.group(1).strip()
+        line_end = text.find("\n", match.end(1))
+        if line_end == -1:
+            line_end = len(text)
 
         if base_name == 'Рецепт':
-            m = resource_receipt_name_pattern.search(text)
+            m = resource_receipt_name_pattern.search(text, match.start(1), line_end)
+            if not m:
+                return None, None, None
             name = (m.group(1) + m.group(2)).strip()
 
         elif base_name == 'Зелье':
-            m = resource_potion_name_pattern.search(text)
+            m = resource_potion_name_pattern.search(text, match.start(1), line_end)
+            d = duration_potion_pattern.search(text, match.start(1))
+            if not m or not d:
+                return None, None, None
             name = (m.group(1) + m.group(2)).strip()
-            duration = duration_potion_pattern.search(text).group(1).strip()
+            duration = d.group(1).strip()
 
         elif (
             'Требуется для изучения навыка' in text
@@ -127,6 +132,9 @@ def parse_name_grade_duration(item_type, text):
         else:
             name = base_name
 
+    else:
+        return None, None, None
+
     # Grade
     if grade is None:
         m = grade_pattern.search(text)
@@ -134,13 +142,13 @@ def parse_name_grade_duration(item_type, text):
 
     # Duration
     if duration is None:
-        m = duration_pattern.search(text)
+        m = duration_pattern.search(text, match.start(1))
         duration = m.group(1).strip() if m else "undefined"
 
     # Check duration in name
     temp_duration = duration_in_name_pattern.search(name)
     if temp_duration:
-        name = re.sub(duration_in_name_pattern, '', name).strip()
+        name = name[:temp_duration.start()].strip()
 
     if duration == 'undefined' and temp_duration:
         duration = temp_duration.group(1).strip()
@@ -0,0 +1,187 @@
+import logging
+import re
+
+# Logging
+logger = logging.getLogger(__name__)
+
+sell_keywords = {"продам", "продаю", "продажа"}
+buy_keywords = {"куплю", "покупаю", "покупка", "скупка"}
+
+roman_numerals = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X"]
+
+# Patterns
+keyword_pattern = re.compile(r"^(?P<keyword>[А-Яа-яЁё]+)\s*:?\s*(?P<rest>.*)$")
+offer_line_pattern = re.compile(
+    r"^(?:[•*▪️-]\s*)?"
+    r"(?P<name>[A-Za-zА-Яа-яЁё][A-Za-zА-Яа-яЁё'’ -]*?)\s*"
+    r"(?P<grade>\[(?:I{1,3}|IV|V|VI{1,3}|IX|X)\+?\]|[тТ](?:10|[1-9])\+?)?\s*"
+    r"(?P<duration>\d+\s*(?:ч|час|часа|часов|м|мин|минут|минуты|д|дн|день|дня|дней)\.?)?\s*"
+    r"(?:[xх×]\s*(?P<quantity>\d+)|(?P<quantity_pcs>\d+)\s*шт\.?)?\s*"
+    r"(?:[—–:-]|(?<=\s)(?:по|за)\b)\s*"
+    r"(?P<price>\d+)\s*(?P<currency>🍪|💰|печ[а-яё]*|монет[а-яё]*)"
+    r"(?:\s*[xх×]\s*(?P<quantity_after>\d+))?\s*$",
+    re.IGNORECASE
+)
+duration_pattern = re.compile(r"(?P<amount>\d+)\s*(?P<unit>[а-яё]+)")
+cookies_name_pattern = re.compile(r"^печ[её]н[а-яё]*$", re.IGNORECASE)
+
+# Item name of currency trades (cookies for money), the one the LLM prompt asks for
+COOKIES_ITEM_NAME = "cookies"
+
+# Unit prefix → forms for 1, 2-4 and 5+ (the same Russian forms the LLM prompt asks for)
+duration_units = {
+    "ч": ("час", "часа", "часов"),
+    "м": ("минута", "минуты", "минут"),
+    "д": ("день", "дня", "дней"),
+}
+
+
+# Parses messages written in rigid templates, e.g. "Продам Кирка [III] - 500🍪"
+# or a "Продам"/"Куплю" header followed by one offer per line.
+# Returns offers in the same format as the LLM parser, or None when the message
+# doesn't fully fit the templates (it then goes to the LLM).
+def parse_with_rules(message: str):
+    lines = [line.strip() for line in message.strip().splitlines() if line.strip()]
+    if not lines:
+        return None
+
+    header = keyword_pattern.match(lines[0])
+    if not header:
+        return None
+
+    offer_type = offer_type_from_keyword(header.group("keyword"))
+    if not offer_type:
+        return None
+
+    offer_lines = ([header.group("rest")] if header.group("rest") else []) + lines[1:]
+    if not offer_lines:
+        return None
+
+    offers = []
+    for line in offer_lines:
+        offer = parse_offer_line(line, offer_type)
+        if not offer:
+            return None
+        offers.append(offer)
+
+    return offers
+
+
+def offer_type_from_keyword(keyword):
+    keyword = keyword.lower()
+    if keyword in sell_keywords:
+        return "sell"
+    if keyword in buy_keywords:
+        return "buy"
+    return None
+
+
+def parse_offer_line(line, offer_type):
+    match = offer_line_pattern.match(line)
+    if not match:
+        return None
+
+    name = match.group("name").strip(" -")
+    if not name or offer_type_from_keyword(name.split()[0]):
+        return None
+
+    quantity = match.group("quantity") or match.group("quantity_pcs") or match.group("quantity_after")
+    duration = match.group("duration")
+    currency = match.group("currency").lower()
+
+    return {
+        "item_name": COOKIES_ITEM_NAME if cookies_name_pattern.match(name) else name,
+        "quantity": int(quantity) if quantity else None,
+        "item_grade": normalize_grade(match.group("grade")),
+        "item_duration": normalize_duration(duration) if duration else "undefined",
+        "price_for_one": int(match.group("price")),
+        "offer_type": offer_type,
+        "currency": "cookies" if currency == "🍪" or currency.startswith("печ") else "money"
+    }
+
+
+# "[iii]" → "[III]", "т3+" → "[III+]"
+def normalize_grade(grade):
+    if not grade:
+        return "undefined"
+    if grade.startswith("["):
+        return grade.upper()
+
+    plus = "+" if grade.endswith("+") else ""
+    return f"[{roman_numerals[int(grade[1:].rstrip('+')) - 1]}{plus}]"
+
+
+# "3ч" → "3 часа", "30м" → "30 минут", "7д" → "7 дней"
+def normalize_duration(duration):
+    match = duration_pattern.search(duration.lower())
+    if not match:
+        return "undefined"
+
+    amount = int(match.group("amount"))
+    one, few, many = duration_units[match.group("unit")[0]]
+    if amount % 10 == 1 and amount % 100 != 11:
+        form = one
+    elif 2 <= amount % 10 <= 4 and not 12 <= amount % 100 <= 14:
+        form = few
+    else:
+        form = many
+    return f"{amount} {form}"
+
+
+# Share of messages served without the LLM and agreement with the LLM in shadow mode
+class RuleParserStats:
+
+    def __init__(self):
+        self.served_locally = 0
+        self.sent_to_llm = 0
+        self.shadow_compared = 0
+        self.shadow_agreed = 0
+
+    def local_share(self):
+        total = self.served_locally + self.sent_to_llm
+        return self.served_locally / total if total else 0.0
+
+    def shadow_accuracy(self):
+        return self.shadow_agreed / self.shadow_compared if self.shadow_compared else 0.0
+
+    # Compares rule-based result with the LLM result for the same message (shadow mode)
+    def compare(self, message, local_offers, llm_offers):
+        self.shadow_compared += 1
+        if offers_key(local_offers) == offers_key(llm_offers):
+            self.shadow_agreed += 1
+            logger.debug("Rule-based parse agrees with LLM")
+        else:
+            logger.debug(f"Rule-based parse differs from LLM for {message!r}: rules={local_offers}, llm={llm_offers}")
+
+        logger.info(
+            f"Rule parser shadow accuracy: {self.shadow_accuracy():.1%} "
+            f"({self.shadow_agreed}/{self.shadow_compared})"
+        )
+
+    def stats(self):
+        return {
+            "served_locally": self.served_locally,
+            "sent_to_llm": self.sent_to_llm,
+            "local_share": self.local_share(),
+            "shadow_compared": self.shadow_compared,
+            "shadow_agreed": self.shadow_agreed
+        }
+
+
+# Order-independent form of parsed offers for comparison
+def offers_key(offers):
+    return sorted(
+        (
+            str(offer.get("item_name", "")).strip().lower(),
+            offer.get("item_grade"),
+            offer.get("item_duration"),
+            offer.get("quantity"),
+            offer.get("price_for_one"),
+            offer.get("offer_type"),
+            offer.get("currency")
+        )
+        for offer in offers or []
+    )
+
+
+rule_parser_stats = RuleParserStats()
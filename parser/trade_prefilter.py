@@ -0,0 +1,53 @@
+import logging
+import re
+from functools import lru_cache
+from rapidfuzz import process, fuzz
+
+# Logging
+logger = logging.getLogger(__name__)
+
+keywords = ["продам", "продажа", "продаю", "куплю", "скупка", "покупаю", "покупка"]
+word_pattern = re.compile(r"\w+")
+
+# Built once at import:
+# any keyword inside a token means partial_ratio 100
+keyword_pattern = re.compile("|".join(keywords))
+# any token that is a part of a keyword also means partial_ratio 100
+keyword_substrings = frozenset(
+    kw[start:end] for kw in keywords for start in range(len(kw)) for end in range(start + 1, len(kw) + 1)
+)
+# a token without a single keyword letter always scores 0
+keyword_alphabet = frozenset("".join(keywords))
+
+
+# Same decision as the fuzzy check below for a single token, cached per token:
+# only tokens that share letters with the keywords reach rapidfuzz.
+@lru_cache(maxsize=65536)
+def token_matches(token: str, threshold: int) -> bool:
+    if threshold <= 0:
+        return True
+    if token in keyword_substrings:
+        return threshold <= 100
+    if keyword_alphabet.isdisjoint(token):
+        return False
+    return any(fuzz.partial_ratio(kw, token, score_cutoff=threshold) >= threshold for kw in keywords)
+
+
+# Checks if message contains 'buy' or 'sell' keywords with fuzzy matching.
+def contains_buy_sell(text: str, threshold: int = 85) -> bool:
+    text = text.lower()
+    if threshold <= 100 and keyword_pattern.search(text):
+        return True
+
+    return any(token_matches(word, threshold) for word in dict.fromkeys(word_pattern.findall(text)))
+
+
+# Reference implementation, kept for benchmarks (see benchmarks/prefilter_benchmark.py)
+def contains_buy_sell_fuzzy(text: str, threshold: int = 85) -> bool:
+    words = re.findall(r"\w+", text.lower())
+
+    for kw in keywords:
+        match = process.extractOne(query=kw, choices=words, scorer=fuzz.partial_ratio)
+        if match and match[1] >= threshold:
+            return True
+    return False
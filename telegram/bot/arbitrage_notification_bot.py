@@ -1,13 +1,19 @@
 import asyncio
 import textwrap
+import time
 import logging
-from database.queries import delete_offer_by_id, update_quantity_in_offer_by_id
+from database.queries import delete_offer_by_id, update_quantity_in_offer_by_id, get_arbitrages_data_for_bot
+from logic.message_processing.order_book import order_book
+from database.models import OfferType, CurrencyType
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from config import settings
+from metrics import stage_seconds
+from tracing import current_span, record_span
 
 # =============================
 #  Logging setup
@@ -30,45 +36,53 @@ class EditOffer(StatesGroup):
 # =============================
 #  Arbitrage notification
 # =============================
-async def send_telegram_message(query_result):
-    """Sends formatted arbitrage message with action buttons."""
+SEPARATOR = "━━━━━━━━━━━━━━━━━━━━"
+DIGEST_MARKER = "ARBITRAGES FOUND"
+MAX_SEND_ATTEMPTS = 5
+
+
+def message_link(offer):
+    return f"https://t.me/c/{str(settings.trade_group_id)[4:]}/{offer.message.message_group_id}"
+
+
+def sender_link(offer):
+    return f"https://t.me/{offer.message.sender_username}"
+
+
+def format_arbitrage_message(query_result):
+    """Builds text and action buttons of a single arbitrage notification."""
     item = query_result.buy_offer_rel.item
     sell_offer = query_result.sell_offer_rel
     buy_offer = query_result.buy_offer_rel
 
-    sell_link = f"https://t.me/c/{str(settings.trade_group_id)[4:]}/{sell_offer.message.message_group_id}"
-    buy_link = f"https://t.me/c/{str(settings.trade_group_id)[4:]}/{buy_offer.message.message_group_id}"
-    sell_sender_link = f"https://t.me/{sell_offer.message.sender_username}"
-    buy_sender_link = f"https://t.me/{buy_offer.message.sender_username}"
-
     text = textwrap.dedent(f"""
     🚨🚨  ARBITRAGE FOUND!  🚨🚨
 
     📦 ITEM INFO
-    ━━━━━━━━━━━━━━━━━━━━
+    {SEPARATOR}
     🪙 Name: {item.item_name}
     🏷️ Type: {item.item_type.name}
     ⭐ Grade: {item.item_grade}
     ⌛ Duration: {item.item_duration}
 
     💰 ARBITRAGE DATA
-    ━━━━━━━━━━━━━━━━━━━━
+    {SEPARATOR}
     💵 Currency: {query_result.currency.name}
     📈 Profit (per one): {query_result.profit_for_one}
     💹 Profit (total): {query_result.profit_for_all}
     💰 Total price: {query_result.price_for_all}
 
     📤 SELL OFFER
-    ━━━━━━━━━━━━━━━━━━━━
-    🔗 Message: {sell_link}
-    👤 Seller: {sell_sender_link}
+    {SEPARATOR}
+    🔗 Message: {message_link(sell_offer)}
+    👤 Seller: {sender_link(sell_offer)}
     💵 Price (per one): {sell_offer.price_for_one}
     📦 Quantity: {sell_offer.quantity}
 
     📥 BUY OFFER
-    ━━━━━━━━━━━━━━━━━━━━
-    🔗 Message: {buy_link}
-    👤 Buyer: {buy_sender_link}
+    {SEPARATOR}
+    🔗 Message: {message_link(buy_offer)}
+    👤 Buyer: {sender_link(buy_offer)}
     💵 Price (per one): {buy_offer.price_for_one}
     📦 Quantity: {buy_offer.quantity}
     """)
@@ -86,10 +100,213 @@ async def send_telegram_message(query_result):
             InlineKeyboardButton(text="💣 Delete BOTH", callback_data=f"delete_both:{buy_offer.id}:{sell_offer.id}")
         ]
     ])
+    return text, keyboard
+
+
+def format_arbitrage_digest(query_results):
+    """Builds one notification for several arbitrages of the same item, with buttons for every offer."""
+    item = query_results[0].buy_offer_rel.item
+
+    lines = [
+        "",
+        f"🚨🚨  {len(query_results)} {DIGEST_MARKER}!  🚨🚨",
+        "",
+        "📦 ITEM INFO",
+        SEPARATOR,
+        f"🪙 Name: {item.item_name}",
+        f"🏷️ Type: {item.item_type.name}",
+        f"⭐ Grade: {item.item_grade}",
+        f"⌛ Duration: {item.item_duration}",
+    ]
+
+    offers = {}
+    for number, query_result in enumerate(query_results, start=1):
+        sell_offer = query_result.sell_offer_rel
+        buy_offer = query_result.buy_offer_rel
+        offers.setdefault(("sell", sell_offer.id), sell_offer)
+        offers.setdefault(("buy", buy_offer.id), buy_offer)
+
+        # Offer ids in section headers let the edit handler find the offer's quantity lines
+        lines += [
+            "",
+            f"💰 ARBITRAGE {number}",
+            SEPARATOR,
+            f"💵 Currency: {query_result.currency.name}",
+            f"📈 Profit (per one): {query_result.profit_for_one}",
+            f"💹 Profit (total): {query_result.profit_for_all}",
+            f"💰 Total price: {query_result.price_for_all}",
+            f"📤 SELL OFFER #{sell_offer.id}",
+            f"🔗 Message: {message_link(sell_offer)}",
+            f"👤 Seller: {sender_link(sell_offer)}",
+            f"💵 Price (per one): {sell_offer.price_for_one}",
+            f"📦 Quantity: {sell_offer.quantity}",
+            f"📥 BUY OFFER #{buy_offer.id}",
+            f"🔗 Message: {message_link(buy_offer)}",
+            f"👤 Buyer: {sender_link(buy_offer)}",
+            f"💵 Price (per one): {buy_offer.price_for_one}",
+            f"📦 Quantity: {buy_offer.quantity}",
+        ]
 
-    sent_message = await bot.send_message(settings.my_id, text, reply_markup=keyboard)
-    logger.info(f"Arbitrage message sent (buy_id={buy_offer.id}, sell_id={sell_offer.id})")
-    return sent_message.message_id
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text=f"🗑️ Delete {offer_type.upper()} #{offer_id}",
+                callback_data=f"delete_{offer_type}:{offer_id}"
+            ),
+            InlineKeyboardButton(
+                text=f"✏️ Edit {offer_type.upper()} #{offer_id}",
+                callback_data=f"edit_{offer_type}:{offer_id}:{offer.quantity}"
+            )
+        ]
+        for (offer_type, offer_id), offer in offers.items()
+    ])
+    return "\n".join(lines) + "\n", keyboard
+
+
+class TokenBucket:
+    """Allows `rate` sends per second on average and bursts of up to `capacity` sends."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        while True:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Empties the bucket for `seconds` (after a flood-wait error)."""
+        self.refill()
+        self.tokens = -seconds * self.rate
+
+
+class ArbitrageNotifier:
+    """Sends arbitrage notifications from a queue, so message processing never waits on the Bot API.
+
+    Arbitrage ids queued within `window` seconds are loaded in one query, grouped by item and
+    sent as one digest per item (up to `digest_size` arbitrages each). Sends go through a
+    token bucket, and flood-wait errors are retried after the delay Telegram asks for.
+
+    Arbitrages queued from a traced message get notify_wait (queued until sent) and notify
+    (the send itself) spans in that message's trace.
+    """
+
+    def __init__(self, rate, burst, window, digest_size):
+        self.queue = asyncio.Queue()
+        self.bucket = TokenBucket(rate, burst)
+        self.window = window
+        self.digest_size = digest_size
+        self.sent = 0
+        self.failed = 0
+        self.traced = {}
+
+    def enqueue(self, arbitrage_ids):
+        arbitrage_ids = list(arbitrage_ids)
+        parent = current_span.get()
+        if parent is not None:
+            enqueued_at = time.time_ns()
+            for arbitrage_id in arbitrage_ids:
+                self.traced[arbitrage_id] = (parent, enqueued_at)
+        self.queue.put_nowait(arbitrage_ids)
+
+    async def run(self):
+        while True:
+            arbitrage_ids = await self.take()
+            traced = {
+                arbitrage_id: self.traced.pop(arbitrage_id)
+                for arbitrage_id in arbitrage_ids if arbitrage_id in self.traced
+            }
+            try:
+                query_results = await get_arbitrages_data_for_bot(arbitrage_ids)
+            except Exception as e:
+                logger.error(f"Error while loading arbitrage data (arbitrage_ids={arbitrage_ids}): {e}")
+                continue
+
+            for group in self.group(query_results):
+                if len(group) == 1:
+                    text, keyboard = format_arbitrage_message(group[0])
+                else:
+                    text, keyboard = format_arbitrage_digest(group)
+                group_ids = [query_result.id for query_result in group]
+
+                started = time.time_ns()
+                await self.send(text, keyboard, group_ids)
+                self.trace_send(traced, group_ids, started)
+
+    # One notify_wait and one notify span per traced message in the sent group
+    @staticmethod
+    def trace_send(traced, group_ids, started):
+        ended = time.time_ns()
+        parents = {}
+        for arbitrage_id in group_ids:
+            if arbitrage_id in traced:
+                parent, enqueued_at = traced[arbitrage_id]
+                parents.setdefault(parent.span_id, (parent, enqueued_at))
+
+        for parent, enqueued_at in parents.values():
+            record_span(parent, "notify_wait", enqueued_at, started)
+            record_span(parent, "notify", started, ended, arbitrages=len(group_ids))
+
+    async def take(self):
+        """Waits for arbitrage ids, then collects whatever else arrives within the window.
+
+        The window is a plain sleep followed by get_nowait(), not wait_for(queue.get()):
+        on Python 3.11 wait_for can swallow a cancellation that races with a queue item.
+        """
+        arbitrage_ids = await self.queue.get()
+        await asyncio.sleep(self.window)
+        while not self.queue.empty():
+            arbitrage_ids += self.queue.get_nowait()
+        return arbitrage_ids
+
+    def group(self, query_results):
+        by_item = {}
+        for query_result in query_results:
+            by_item.setdefault(query_result.buy_offer_rel.item_id, []).append(query_result)
+
+        return [
+            results[i:i + self.digest_size]
+            for results in by_item.values()
+            for i in range(0, len(results), self.digest_size)
+        ]
+
+    async def send(self, text, keyboard, arbitrage_ids):
+        for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+            await self.bucket.acquire()
+            try:
+                with stage_seconds.time(stage="notify"):
+                    await bot.send_message(settings.my_id, text, reply_markup=keyboard)
+                self.sent += 1
+                logger.info(f"Arbitrage message sent (arbitrage_ids={arbitrage_ids})")
+                return
+            except TelegramRetryAfter as e:
+                logger.warning(f"Flood wait {e.retry_after}s from Bot API (attempt {attempt})")
+                self.bucket.pause(e.retry_after)
+            except TelegramNetworkError as e:
+                logger.warning(f"Network error while sending arbitrage message (attempt {attempt}): {e}")
+                await asyncio.sleep(attempt)
+            except Exception as e:
+                logger.error(f"Failed to send arbitrage message (arbitrage_ids={arbitrage_ids}): {e}")
+                break
+
+        self.failed += 1
+        logger.error(f"Arbitrage message dropped (arbitrage_ids={arbitrage_ids})")
+
+
+arbitrage_notifier = ArbitrageNotifier(
+    settings.notify_rate, settings.notify_burst, settings.notify_coalesce_window, settings.notify_digest_size
+)
 
 
 # =============================
@@ -121,26 +338,63 @@ async def delete_offer(callback: types.CallbackQuery):
     await callback.answer()
 
 
+def without_offer_buttons(markup, offer_id):
+    """Drops buttons of a deleted offer from a digest keyboard."""
+    rows = [
+        [button for button in row if button.callback_data.split(":")[1] != str(offer_id)]
+        for row in markup.inline_keyboard
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[row for row in rows if row])
+
+
+async def remove_offer(offer_id):
+    """Deletes an offer: from the order book first, so workers stop pairing new offers with it,
+    then from DB. The offer goes back into the book if the delete fails."""
+    removed = order_book.remove(offer_id)
+    try:
+        await delete_offer_by_id(offer_id)
+    except Exception:
+        if removed is not None:
+            order_book.restore(removed)
+        raise
+
+
 @dp.callback_query(F.data.startswith("confirm_delete"))
-async def confirm_delete(callback: types.CallbackQuery):
+async def confirm_delete(callback: types.CallbackQuery, state: FSMContext):
     """Deletes offer(s) from DB after confirmation."""
     parts = callback.data.split(":")
     offer_type = parts[1]
 
+    # Notification the deletion started from (a reply target, or saved by the edit flow)
+    original = callback.message.reply_to_message
+    if original is not None:
+        original_text, original_markup = original.text, original.reply_markup
+    else:
+        data = await state.get_data()
+        original_text, original_markup = data.get("message_text"), data.get("message_reply_markup")
+
     try:
         if offer_type == "both":
             buy_id, sell_id = int(parts[2]), int(parts[3])
-            await delete_offer_by_id(buy_id)
-            await delete_offer_by_id(sell_id)
+            await remove_offer(buy_id)
+            await remove_offer(sell_id)
             logger.info(f"Deleted BOTH offers (buy_id={buy_id}, sell_id={sell_id})")
             await bot.edit_message_text(chat_id=callback.message.chat.id, message_id=int(parts[4]),
                                         text="🚨🚨  ARBITRAGE DELETED!  🚨🚨\n\n💥 BOTH OFFERS DELETED")
         else:
             offer_id = int(parts[2])
-            await delete_offer_by_id(offer_id)
+            await remove_offer(offer_id)
             logger.info(f"Deleted {offer_type.upper()} offer (id={offer_id})")
-            await bot.edit_message_text(chat_id=callback.message.chat.id, message_id=int(parts[3]),
-                                        text=f"🚨🚨  ARBITRAGE DELETED!  🚨🚨\n\n💥 {offer_type.upper()} OFFER DELETED")
+            if original_text and DIGEST_MARKER in original_text:
+                # Other arbitrages of a digest stay valid: mark the offer instead of replacing the text
+                await bot.edit_message_text(
+                    chat_id=callback.message.chat.id, message_id=int(parts[3]),
+                    text=f"{original_text}\n💥 {offer_type.upper()} OFFER #{offer_id} DELETED",
+                    reply_markup=without_offer_buttons(original_markup, offer_id) if original_markup else None
+                )
+            else:
+                await bot.edit_message_text(chat_id=callback.message.chat.id, message_id=int(parts[3]),
+                                            text=f"🚨🚨  ARBITRAGE DELETED!  🚨🚨\n\n💥 {offer_type.upper()} OFFER DELETED")
 
         await callback.message.edit_text("✅ Deletion completed")
     except Exception as e:
@@ -220,6 +474,7 @@ async def confirm_edit(callback: types.CallbackQuery, state: FSMContext):
 
     try:
         await update_quantity_in_offer_by_id(offer_id, new_value)
+        order_book.update_quantity(offer_id, new_value)
         logger.info(f"Updated {offer_type.upper()} offer (id={offer_id}) to quantity={new_value}")
     except Exception as e:
         logger.error(f"Failed to update offer quantity: {e}")
@@ -229,15 +484,17 @@ async def confirm_edit(callback: types.CallbackQuery, state: FSMContext):
     section_start = "📤 SELL OFFER" if offer_type.upper() == 'SELL' else "📥 BUY OFFER"
     in_section = False
 
+    # Digest headers carry the offer id ("📤 SELL OFFER #12"); the same offer can appear in several sections
     for i, line in enumerate(lines):
-        if line.strip().startswith(section_start):
-            in_section = True
+        header = line.strip()
+        if header.startswith(section_start):
+            in_section = "#" not in header or header.endswith(f"#{offer_id}")
             continue
-        if in_section and line.strip().startswith("📦 Quantity:"):
+        if in_section and header.startswith("📦 Quantity:"):
             prefix = "📦 Quantity: "
             pos = line.find(prefix) + len(prefix)
             lines[i] = line[:pos] + str(new_value)
-            break
+            in_section = False
 
     updated_text = "\n".join(lines)
 
@@ -250,6 +507,90 @@ async def confirm_edit(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer("Updated")
 
 
+# =============================
+#  Market commands (served from the in-memory order book)
+# =============================
+def format_offer_line(offer):
+    quantity = offer['quantity'] if offer['quantity'] is not None else "?"
+    return f"    {offer['price_for_one']} × {quantity}  (#{offer['id']})"
+
+
+def format_book(item_id):
+    lines = [f"📖 {order_book.label(item_id)}", SEPARATOR]
+    for currency in CurrencyType:
+        buys = order_book.best_offers(item_id, currency, OfferType.BUY)
+        sells = order_book.best_offers(item_id, currency, OfferType.SELL)
+        if not buys and not sells:
+            continue
+        lines.append(f"💵 {currency.name}")
+        lines.append("📥 BUY (highest first):")
+        lines += [format_offer_line(offer) for offer in buys] or ["    —"]
+        lines.append("📤 SELL (lowest first):")
+        lines += [format_offer_line(offer) for offer in sells] or ["    —"]
+    return "\n".join(lines)
+
+
+@dp.message(Command("book"))
+async def book_command(message: types.Message, command: CommandObject):
+    """Shows best open buy/sell offers for an item."""
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer("Usage: /book <item name>")
+        return
+
+    matches = order_book.find_items(query)
+    exact = [(item_id, label) for item_id, label in matches if label.casefold().startswith(query.casefold() + " ")]
+    if len(matches) > 1 and len(exact) == 1:
+        matches = exact
+
+    if not matches:
+        await message.answer(f"No open offers for '{query}'.")
+    elif len(matches) > 1:
+        listed = "\n".join(f"• {label}" for _, label in matches[:10])
+        more = f"\n… and {len(matches) - 10} more" if len(matches) > 10 else ""
+        await message.answer(f"Several items match '{query}', be more specific:\n{listed}{more}")
+    else:
+        await message.answer(format_book(matches[0][0]))
+
+
+@dp.message(Command("top"))
+async def top_command(message: types.Message):
+    """Shows open arbitrages with the largest total profit."""
+    arbitrages = order_book.top_arbitrages()
+    if not arbitrages:
+        await message.answer("No open arbitrages.")
+        return
+
+    lines = ["💹 TOP ARBITRAGES", SEPARATOR]
+    for arbitrage in arbitrages:
+        item_id = order_book.offers[arbitrage['buy_offer']]['item_id']
+        profit_for_all = arbitrage['profit_for_all'] if arbitrage['profit_for_all'] is not None else "?"
+        lines.append(
+            f"{order_book.label(item_id)} ({arbitrage['currency'].name})\n"
+            f"    profit {profit_for_all} total, {arbitrage['profit_for_one']} per one\n"
+            f"    buy #{arbitrage['buy_offer']} / sell #{arbitrage['sell_offer']} @ {arbitrage['price_for_one']}"
+        )
+    await message.answer("\n".join(lines))
+
+
+@dp.message(Command("spread"))
+async def spread_command(message: types.Message):
+    """Shows items with the largest gap between best buy and best sell price."""
+    spreads = order_book.spreads()
+    if not spreads:
+        await message.answer("No items with both buy and sell offers.")
+        return
+
+    lines = ["📊 SPREADS (best buy − best sell)", SEPARATOR]
+    for spread in spreads:
+        lines.append(
+            f"{order_book.label(spread['item_id'])} ({spread['currency'].name}): "
+            f"buy {spread['best_buy']['price_for_one']} / sell {spread['best_sell']['price_for_one']} "
+            f"→ {spread['spread']}"
+        )
+    await message.answer("\n".join(lines))
+
+
 # =============================
 #  Cancel handlers
 # =============================
@@ -273,7 +614,22 @@ async def cancel_command(message: types.Message, state: FSMContext):
 # =============================
 async def bot_execution():
     logger.info("Bot is running...")
-    await dp.start_polling(bot)
+    notifier_task = asyncio.create_task(arbitrage_notifier.run())
+    try:
+        await bot.set_my_commands([
+            types.BotCommand(command="book", description="Best buy/sell offers for an item"),
+            types.BotCommand(command="top", description="Open arbitrages with the largest profit"),
+            types.BotCommand(command="spread", description="Items with the largest buy/sell spread"),
+            types.BotCommand(command="cancel", description="Cancel current action"),
+        ])
+    except Exception as e:
+        logger.warning(f"Could not register bot commands: {e}")
+
+    try:
+        await dp.start_polling(bot)
+    finally:
+        notifier_task.cancel()
+        await asyncio.gather(notifier_task, return_exceptions=True)
 
 
 if __name__ == "__main__":
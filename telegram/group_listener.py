@@ -1,15 +1,18 @@
 import logging
+import time
 from config import settings
 from telethon import events
 from telegram.tg_client import client
+from tracing import start_trace
 
 # Logging
 logger = logging.getLogger(__name__)
 
-# Listens for new trade messages and adds them to queue.
+# Listens for new trade messages and adds them to queue (waits while the queue is full).
+# Each message starts its trace here (when sampled), so queue time is part of it.
 async def trade_group_listener(offer_message_queue=None):
     @client.on(events.NewMessage(chats=settings.trade_group_id, incoming=True, outgoing=True))
     async def group_handler(event):
         logger.debug(f"New trade message received: {event.raw_text[:100]}")  # Logging only first 100 symbols
-        print(event.raw_text)
-        await offer_message_queue.put(event)
+        trace = start_trace("trade_message", chat_message_id=event.id)
+        await offer_message_queue.put((event, time.monotonic(), trace))
@@ -8,11 +8,11 @@ from parser.items_info_message_parser import items_info_parser
 logger = logging.getLogger(__name__)
 
 # Listens for new item messages and sends them to parser.
-async def items_listener(items_type_and_id_queue, async_flag):
+async def items_listener(collector):
     @client.on(events.NewMessage(chats=settings.items_info_group_id, incoming=True))
     async def items_info_handler(event):
         logger.debug("New message received in items_info_group.")
-        await items_info_parser(event, items_type_and_id_queue, async_flag)
+        await items_info_parser(event, collector)
 
 
 
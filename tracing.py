@@ -0,0 +1,208 @@
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import time
+from collections import deque
+from contextlib import nullcontext
+
+import aiohttp
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Spans kept in memory between exports; older ones are dropped when an exporter falls behind
+MAX_BUFFERED_SPANS = 10_000
+SERVICE_NAME = "trade-client-worker"
+
+current_span = contextvars.ContextVar("current_span", default=None)
+no_span = nullcontext()
+
+
+# Timed operation of a traced trade message. A span entered as a context manager becomes
+# the parent of spans opened inside it (also across awaits, through the context variable).
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "end", "error", "token")
+
+    def __init__(self, trace_id, parent_id, name, attributes, start=None):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time_ns() if start is None else start
+        self.end = None
+        self.error = None
+        self.token = None
+
+    def __enter__(self):
+        self.start = time.time_ns()
+        self.token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        current_span.reset(self.token)
+        self.finish(exc)
+        return False
+
+    def finish(self, exc=None, end=None):
+        self.end = time.time_ns() if end is None else end
+        if exc is not None:
+            self.error = f"{type(exc).__name__}: {exc}"
+        span_exporter.add(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start,
+            "duration_ms": (self.end - self.start) / 1e6,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+# Root span of a new trace, or None when tracing is off or the message isn't sampled
+def start_trace(name, **attributes):
+    if settings.trace_mode == "off" or random.random() >= settings.trace_sample_rate:
+        return None
+    return Span(f"{random.getrandbits(128):032x}", None, name, attributes)
+
+
+# Child span of the current one (a no-op outside a sampled trace)
+def span(name, **attributes):
+    parent = current_span.get()
+    if parent is None:
+        return no_span
+    return Span(parent.trace_id, parent.span_id, name, attributes)
+
+
+# Finished span with explicit times (e.g. time spent in a queue)
+def record_span(parent, name, start, end, **attributes):
+    if parent is None:
+        return
+    Span(parent.trace_id, parent.span_id, name, attributes, start=start).finish(end=end)
+
+
+# Makes a trace created elsewhere (in the listener) the current one
+def activate(trace):
+    if trace is None:
+        return no_span
+    return ActiveTrace(trace)
+
+
+class ActiveTrace:
+    __slots__ = ("trace", "token")
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.token = None
+
+    def __enter__(self):
+        self.token = current_span.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        current_span.reset(self.token)
+        return False
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(span_obj):
+    otlp = {
+        "traceId": span_obj.trace_id,
+        "spanId": span_obj.span_id,
+        "name": span_obj.name,
+        "kind": 1,
+        "startTimeUnixNano": str(span_obj.start),
+        "endTimeUnixNano": str(span_obj.end),
+        "attributes": [{"key": key, "value": otlp_value(value)} for key, value in span_obj.attributes.items()],
+        "status": {"code": 2, "message": span_obj.error} if span_obj.error else {"code": 1}
+    }
+    if span_obj.parent_id:
+        otlp["parentSpanId"] = span_obj.parent_id
+    return otlp
+
+
+def append_lines(path, lines):
+    with open(path, "a", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+# Collects finished spans and exports them in batches: to a JSON-lines file (TRACE_MODE=jsonl)
+# or to an OTLP/HTTP collector as JSON (TRACE_MODE=otlp). Export runs in the background,
+# the file is written from a thread.
+class SpanExporter:
+
+    def __init__(self):
+        self.spans = deque(maxlen=MAX_BUFFERED_SPANS)
+        self.exported = 0
+        self.dropped = 0
+        self.session = None
+
+    def add(self, span_obj):
+        if len(self.spans) == self.spans.maxlen:
+            self.dropped += 1
+        self.spans.append(span_obj)
+
+    async def run(self):
+        if settings.trace_mode == "off":
+            return
+
+        logger.info(
+            f"Tracing {settings.trace_sample_rate:.0%} of trade messages to "
+            f"{settings.trace_file if settings.trace_mode == 'jsonl' else settings.trace_otlp_endpoint}"
+        )
+        try:
+            while True:
+                await asyncio.sleep(settings.trace_flush_interval)
+                await self.flush()
+        finally:
+            await self.flush()
+            if self.session is not None:
+                await self.session.close()
+
+    async def flush(self):
+        spans = list(self.spans)
+        self.spans.clear()
+        if not spans:
+            return
+
+        try:
+            if settings.trace_mode == "jsonl":
+                lines = [json.dumps(span_obj.to_dict(), ensure_ascii=False) + "\n" for span_obj in spans]
+                await asyncio.to_thread(append_lines, settings.trace_file, lines)
+            elif settings.trace_mode == "otlp":
+                await self.post_otlp(spans)
+            self.exported += len(spans)
+        except Exception as e:
+            self.dropped += len(spans)
+            logger.error(f"Failed to export {len(spans)} spans: {e}")
+
+    async def post_otlp(self, spans):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "trade-client"}, "spans": [otlp_span(s) for s in spans]}]
+        }]}
+        async with self.session.post(settings.trace_otlp_endpoint, json=payload) as response:
+            if response.status >= 300:
+                raise RuntimeError(f"collector answered {response.status}: {(await response.text())[:200]}")
+
+
+span_exporter = SpanExporter()